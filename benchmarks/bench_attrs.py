@@ -0,0 +1,90 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Measure the time spent to convert the 'attrs' of the views to attributes
+(16.0 -> 17.0), on generated view files with a growing number of view
+records, and deep domains. The time by record should not grow with the
+size of the file.
+
+    python benchmarks/bench_attrs.py
+"""
+
+import logging
+import os
+import time
+from xml.sax.saxutils import escape
+
+from odoo_module_migrate import tools
+from odoo_module_migrate.file_buffer import FileBuffer
+from odoo_module_migrate.log import logger
+from odoo_module_migrate.migration_scripts.migrate_160_170 import (
+    _move_attrs_to_attributes_view,
+)
+
+MODULE_PATH = os.path.join(os.sep, "bench_attrs")
+DOMAIN_DEPTH = 50
+
+VIEW = """
+    <record id="view_form_{i}" model="ir.ui.view">
+        <field name="model">bench.model</field>
+        <field name="arch" type="xml">
+            <form>
+                <field name="name" attrs="{{'invisible': {domain}}}"/>
+                <field name="state"/>
+                <field name="partner_id" attrs="{{'readonly': [('state', '=', 'done')], 'required': {domain}}}"/>
+            </form>
+        </field>
+    </record>
+    <record id="view_form_inherit_{i}" model="ir.ui.view">
+        <field name="model">bench.model</field>
+        <field name="inherit_id" ref="view_form_{i}"/>
+        <field name="arch" type="xml">
+            <field name="state" position="attributes">
+                <attribute name="attrs">{{'invisible': {domain}}}</attribute>
+            </field>
+        </field>
+    </record>"""
+
+
+def get_domain(depth):
+    """Return a domain of depth leaves, nested depth times:
+    ['|', leaf_0, '&', '!', leaf_1, '|', leaf_2, ..., leaf_last]"""
+    elements = []
+    for i in range(depth - 1):
+        elements.append(repr("|&"[i % 2]))
+        if i % 3 == 1:
+            elements.append(repr("!"))
+        elements.append("('field_%d', '!=', False)" % i)
+    elements.append("('field_last', '=', 1)")
+    return "[%s]" % ", ".join(elements)
+
+
+def get_view_file(records):
+    domain = escape(get_domain(DOMAIN_DEPTH))
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<odoo>'
+        + "".join(VIEW.format(i=i, domain=domain) for i in range(records))
+        + "\n</odoo>\n"
+    )
+
+
+def migrate(records):
+    file_path = os.path.join(MODULE_PATH, "views.xml")
+    file_buffer = FileBuffer(MODULE_PATH, {file_path: get_view_file(records)})
+    with tools._use_file_buffer(file_buffer):
+        start = time.perf_counter()
+        _move_attrs_to_attributes_view(logger, file_path, tools)
+        tools._read_content(file_path)
+        duration = time.perf_counter() - start
+    assert "attrs" not in file_buffer.read(file_path)
+    return duration
+
+
+def main():
+    logger.setLevel(logging.CRITICAL)
+    print("%8s %12s %14s" % ("records", "time", "time/record"))
+    for records in (100, 1000, 5000):
+        duration = migrate(records)
+        print("%8d %11.4fs %12.1fus" % (records, duration, duration / records * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Compare the time spent to migrate a module from 8.0 to the latest
+version, running the migration steps one after another, and in fused mode.
+
+    python benchmarks/bench_fused.py
+"""
+
+import filecmp
+import logging
+import pathlib
+import shutil
+import tempfile
+import time
+
+from odoo_module_migrate.log import logger
+from odoo_module_migrate.migration import Migration
+from odoo_module_migrate.tools import _get_latest_version_name
+
+TEMPLATE_PATH = pathlib.Path(__file__).parent.parent / "tests" / "data_template"
+MODULE_NAME = "module_080"
+
+
+def create_module(directory_path, copies):
+    """Copy the module of the tests, with its models and views duplicated
+    the given number of times."""
+    module_path = directory_path / MODULE_NAME
+    shutil.copytree(TEMPLATE_PATH / MODULE_NAME, module_path)
+    for i in range(copies):
+        for folder in ("models", "views", "demo"):
+            shutil.copytree(module_path / folder, module_path / ("%s_%d" % (folder, i)))
+
+
+def migrate(directory_path, fused):
+    start = time.perf_counter()
+    Migration(
+        str(directory_path),
+        "8.0",
+        _get_latest_version_name(),
+        [MODULE_NAME],
+        commit_enabled=False,
+        pre_commit=False,
+        fused=fused,
+    ).run()
+    return time.perf_counter() - start
+
+
+def is_same_tree(comparison):
+    return not (
+        comparison.diff_files
+        or comparison.left_only
+        or comparison.right_only
+        or comparison.funny_files
+    ) and all(is_same_tree(x) for x in comparison.subdirs.values())
+
+
+def main():
+    logger.setLevel(logging.CRITICAL)
+    print("%8s %12s %12s" % ("files", "stepwise", "fused"))
+    for copies in (0, 10, 100):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            stepwise_path = pathlib.Path(tmp_path) / "stepwise"
+            fused_path = pathlib.Path(tmp_path) / "fused"
+            create_module(stepwise_path, copies)
+            create_module(fused_path, copies)
+            file_count = len(
+                [x for x in (stepwise_path / MODULE_NAME).rglob("*") if x.is_file()]
+            )
+            stepwise_time = migrate(stepwise_path, False)
+            fused_time = migrate(fused_path, True)
+            assert is_same_tree(
+                filecmp.dircmp(stepwise_path / MODULE_NAME, fused_path / MODULE_NAME)
+            )
+            print("%8d %11.4fs %11.4fs" % (file_count, stepwise_time, fused_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Measure the startup time of the command line: displaying the help, and
+migrating from 18.0 to 19.0 a module that has nothing to migrate. Also
+list the heavy modules imported by each command.
+
+    python benchmarks/bench_startup.py
+"""
+
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 10
+HEAVY_MODULES = ("lxml.etree", "yaml", "ast", "argcomplete", "multiprocessing")
+
+MANIFEST = """{
+    "name": "Empty Module",
+    "version": "19.0.1.0.0",
+    "license": "AGPL-3",
+    "installable": True,
+}
+"""
+
+
+def create_module(directory_path):
+    module_path = directory_path / "empty_module"
+    module_path.mkdir()
+    (module_path / "__manifest__.py").write_text(MANIFEST)
+    (module_path / "__init__.py").write_text("")
+
+
+def run(args, cwd):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "odoo_module_migrate"] + args,
+        cwd=cwd,
+        env=dict(os.environ, PYTHONPATH=os.getcwd()),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def imported_modules(args, cwd):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "odoo_module_migrate"] + args,
+        cwd=cwd,
+        env=dict(os.environ, PYTHONPATH=os.getcwd()),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    names = {
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.decode().splitlines()
+        if line.startswith("import time:")
+    }
+    return [x for x in HEAVY_MODULES if x in names]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_path:
+        create_module(pathlib.Path(tmp_path))
+        commands = {
+            "--help": ["--help"],
+            "18.0 -> 19.0 no-op": [
+                "--directory",
+                tmp_path,
+                "--init-version-name",
+                "18.0",
+                "--target-version-name",
+                "19.0",
+                "--no-commit",
+                "--no-pre-commit",
+            ],
+        }
+        print("%-20s %10s %10s   %s" % ("command", "median", "min", "heavy imports"))
+        for name, args in commands.items():
+            times = [run(args, tmp_path) for __ in range(RUNS)]
+            print(
+                "%-20s %9.1fms %9.1fms   %s"
+                % (
+                    name,
+                    statistics.median(times) * 1000,
+                    min(times) * 1000,
+                    ", ".join(imported_modules(args, tmp_path)) or "-",
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Compare the time spent to check text errors and warnings on a file,
+searching each pattern one by one, and with PatternMatcher.
+
+    python benchmarks/bench_text_checks.py
+"""
+
+import pathlib
+import random
+import re
+import string
+import timeit
+
+from odoo_module_migrate.matcher import PatternMatcher
+
+FIELD_PATTERN = r"""(['"]{0}['"]|\.{0}[\s,=])"""
+
+
+def get_text():
+    scripts = pathlib.Path(__file__).parent.parent / "odoo_module_migrate"
+    return "\n".join(x.read_text() for x in sorted(scripts.rglob("*.py")))
+
+
+def get_rules(text, count):
+    random.seed(count)
+    words = sorted(set(re.findall(r"\b[a-z_]{6,}\b", text)))
+    rules = []
+    for i in range(count):
+        # one rule out of ten matches the text
+        if i % 10:
+            name = "".join(random.choices(string.ascii_lowercase + "_", k=12))
+        else:
+            name = random.choice(words)
+        rules.append((FIELD_PATTERN.format(name), "Field %s was renamed" % name))
+    return rules
+
+
+def main():
+    text = get_text()
+    print("Text size: %d characters" % len(text))
+    print("%8s %12s %12s" % ("rules", "one by one", "matcher"))
+    for count in (10, 100, 1000, 5000):
+        rules = get_rules(text, count)
+        compiled = [(re.compile(pattern), value) for pattern, value in rules]
+        matcher = PatternMatcher(rules)
+
+        def one_by_one():
+            return [value for pattern, value in compiled if pattern.search(text)]
+
+        def with_matcher():
+            return [value for value, __ in matcher.search(text)]
+
+        assert one_by_one() == with_matcher()
+        print(
+            "%8d %11.4fs %11.4fs"
+            % (
+                count,
+                min(timeit.repeat(one_by_one, number=1, repeat=3)),
+                min(timeit.repeat(with_matcher, number=1, repeat=3)),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
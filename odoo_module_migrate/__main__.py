@@ -3,19 +3,19 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import argparse
-import argcomplete
+import os
+import signal
 import sys
 
 from . import tools
 from .log import setup_logger
-from .migration import Migration
 
+# Modules that load the migration scripts are only imported once the
+# arguments are parsed, to display the help and the completion quickly.
 
-def get_parser():
-
-    main_parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
 
-    main_parser.add_argument(
+def _add_module_arguments(parser):
+    parser.add_argument(
         "-d",
         "--directory",
         dest="directory",
@@ -26,7 +26,7 @@ def get_parser():
         " to another.",
     )
 
-    main_parser.add_argument(
+    parser.add_argument(
         "-m",
         "--modules",
         dest="modules",
@@ -36,7 +36,7 @@ def get_parser():
         " migrated.",
     )
 
-    main_parser.add_argument(
+    parser.add_argument(
         "-i",
         "--init-version-name",
         choices=tools._get_available_init_version_names(),
@@ -45,7 +45,7 @@ def get_parser():
         type=str,
     )
 
-    main_parser.add_argument(
+    parser.add_argument(
         "-t",
         "--target-version-name",
         dest="target_version_name",
@@ -57,6 +57,32 @@ def get_parser():
         " Odoo version.",
     )
 
+
+def _add_log_arguments(parser):
+    parser.add_argument(
+        "-ll",
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        dest="log_level",
+        default="INFO",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-lp",
+        "--log-path",
+        dest="log_path",
+        default=False,
+        type=str,
+    )
+
+
+def get_parser():
+
+    main_parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    _add_module_arguments(main_parser)
+
     main_parser.add_argument(
         "-fp",
         "--format-patch",
@@ -73,22 +99,7 @@ def get_parser():
         type=str,
     )
 
-    main_parser.add_argument(
-        "-ll",
-        "--log-level",
-        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
-        dest="log_level",
-        default="INFO",
-        type=str,
-    )
-
-    main_parser.add_argument(
-        "-lp",
-        "--log-path",
-        dest="log_path",
-        default=False,
-        type=str,
-    )
+    _add_log_arguments(main_parser)
 
     main_parser.add_argument(
         "-nc",
@@ -117,21 +128,192 @@ def get_parser():
         help="Skip removing migration folder",
     )
 
+    main_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=1,
+        type=int,
+        help="Number of modules to migrate in parallel. Changes are still"
+        " committed one module after another.",
+    )
+
+    main_parser.add_argument(
+        "-fu",
+        "--fused",
+        action="store_true",
+        help="Enable this option to apply the text changes of all the"
+        " migration steps on each file at once, instead of running the"
+        " steps one after another on the whole module. The result is the"
+        " same.",
+    )
+
+    main_parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        help="Enable this option to store the changes done on each file in"
+        " the folder .odoo_module_migrate_cache of the directory, and reuse"
+        " them when migrating again files and rules that did not change.",
+    )
+
+    main_parser.add_argument(
+        "-dr",
+        "--dry-run",
+        dest="dry_run",
+        nargs="?",
+        const="-",
+        default=False,
+        help="Enable this option to write the changes of the migration in"
+        " the given file ('-' or no value for the standard output), in the"
+        " format of 'git diff', instead of changing the modules. Nothing is"
+        " written in the directory, and pre-commit and git are not run. It"
+        " can not be used with the format patch and cache options.",
+    )
+
     return main_parser
 
 
+def get_check_parser():
+
+    check_parser = argparse.ArgumentParser(
+        prog="odoo-module-migrate check",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="Report the errors and warnings that a migration would"
+        " log, with their file and line, without changing anything.",
+    )
+
+    _add_module_arguments(check_parser)
+
+    _add_log_arguments(check_parser)
+
+    check_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        default=os.cpu_count() or 1,
+        type=int,
+        help="Number of processes used to check the files.",
+    )
+
+    check_parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=["json", "sarif"],
+        default="json",
+        type=str,
+    )
+
+    check_parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default="-",
+        type=str,
+        help="File where the report is written. ('-' for the standard output)",
+    )
+
+    return check_parser
+
+
+def check_main(args):
+    """Run the 'check' command. Return 1 if errors are found, 0 otherwise."""
+    from .check import Check, to_json, to_sarif
+
+    parser = get_check_parser()
+    args = parser.parse_args(args)
+
+    setup_logger(args.log_level, args.log_path)
+
+    module_names = (
+        args.modules and [x.strip() for x in args.modules.split(",") if x.strip()] or []
+    )
+    findings = Check(
+        args.directory,
+        args.init_version_name,
+        args.target_version_name,
+        module_names,
+        args.jobs,
+    ).run()
+    report = (args.output_format == "sarif" and to_sarif or to_json)(findings)
+    if args.output == "-":
+        sys.stdout.write(report + "\n")
+    else:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    return int(any(x["level"] == "error" for x in findings))
+
+
+def get_serve_parser():
+
+    serve_parser = argparse.ArgumentParser(
+        prog="odoo-module-migrate serve",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description="Run migrate and check jobs sent on a Unix socket, keeping"
+        " the migration scripts loaded between jobs.",
+    )
+
+    serve_parser.add_argument(
+        "-s",
+        "--socket",
+        dest="socket_path",
+        required=True,
+        type=str,
+        help="Path of the Unix socket the server listens on.",
+    )
+
+    serve_parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        default=os.cpu_count() or 1,
+        type=int,
+        help="Number of worker processes running the jobs.",
+    )
+
+    return serve_parser
+
+
+def serve_main(args):
+    """Run the 'serve' command, until it is interrupted."""
+    from .server import MigrationServer
+
+    args = get_serve_parser().parse_args(args)
+    server = MigrationServer(args.socket_path, args.workers)
+    sys.stderr.write("Listening on %s\n" % args.socket_path)
+    # Stop properly when the server is terminated
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
 def main(args=False):
+    if args is False:
+        args = sys.argv[1:]
+    if args and args[0] == "check":
+        return check_main(args[1:])
+    if args and args[0] == "serve":
+        return serve_main(args[1:])
+
     # Parse Arguments
     parser = get_parser()
-    argcomplete.autocomplete(parser, always_complete_options=False)
-    if args:
-        args = parser.parse_args(args)
-    else:
-        args = parser.parse_args()
+    # argcomplete only completes the arguments if this variable is set
+    if "_ARGCOMPLETE" in os.environ:
+        import argcomplete
+
+        argcomplete.autocomplete(parser, always_complete_options=False)
+    args = parser.parse_args(args)
 
     # Set log level
     setup_logger(args.log_level, args.log_path)
 
+    from .migration import Migration
+
     try:
         # Create a new Migration Object
         module_names = (
@@ -150,6 +332,10 @@ def main(args=False):
             not args.no_commit,
             args.pre_commit,
             args.remove_migration_folder,
+            args.jobs,
+            args.fused,
+            args.cache,
+            args.dry_run,
         )
 
         # run Migration
@@ -160,4 +346,4 @@ def main(args=False):
 
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
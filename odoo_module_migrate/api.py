@@ -0,0 +1,97 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import collections
+import logging
+import os
+
+from .log import logger, LogRecordCollector
+from .migration import Migration
+
+# Directory of the modules migrated in memory. Nothing is read or written
+# in it.
+_IN_MEMORY_DIRECTORY = os.path.join(os.sep, "odoo_module_migrate_in_memory")
+
+MigrationResult = collections.namedtuple(
+    "MigrationResult", ["files", "renames", "diagnostics"]
+)
+
+
+def migrate_files(
+    files,
+    init_version_name,
+    target_version_name,
+    module_names=None,
+    fused=False,
+    remove_migration_folder=True,
+):
+    """Migrate modules in memory, without reading or writing anything on
+    disk, and without git.
+
+    :param files: {path: content} of the files of the modules, the paths
+        being relative to the folder containing the modules
+        (ex: 'my_module/__manifest__.py').
+    :param module_names: modules to migrate. By default, all the modules
+        found in files.
+    :return: a MigrationResult, with
+        * files: {path: content} of all the files, once migrated. The files
+          that are not part of a migrated module are unchanged.
+        * renames: {old path: new path} of the renamed files.
+        * diagnostics: list of {'module', 'level', 'message'} of the
+          warnings and errors logged while migrating the modules.
+    """
+    migration = Migration(
+        _IN_MEMORY_DIRECTORY,
+        init_version_name,
+        target_version_name,
+        module_names,
+        commit_enabled=False,
+        pre_commit=False,
+        remove_migration_folder=remove_migration_folder,
+        fused=fused,
+        files=files,
+    )
+    root = str(migration._directory_path)
+
+    def get_relative_path(path):
+        return os.path.relpath(path, root)
+
+    result_files = {
+        get_relative_path(path): content for path, content in migration._files.items()
+    }
+    renames = {}
+    diagnostics = []
+    for module_migration in migration._module_migrations:
+        module_name = module_migration._module_name
+        collector = LogRecordCollector()
+        logger.addHandler(collector)
+        try:
+            module_migration._run_migration_scripts()
+        finally:
+            logger.removeHandler(collector)
+
+        file_buffer = module_migration._file_buffer
+        prefix = module_name + os.sep
+        for path in [x for x in result_files if x.startswith(prefix)]:
+            del result_files[path]
+        result_files.update(
+            {
+                get_relative_path(path): content
+                for path, content in file_buffer.get_contents().items()
+            }
+        )
+        renames.update(
+            {
+                get_relative_path(old_path): get_relative_path(new_path)
+                for old_path, new_path in file_buffer.get_renames().items()
+            }
+        )
+        diagnostics += [
+            {
+                "module": module_name,
+                "level": record.levelname.lower(),
+                "message": record.getMessage().replace(root + os.sep, ""),
+            }
+            for record in collector.records
+            if record.levelno >= logging.WARNING
+        ]
+    return MigrationResult(result_files, renames, diagnostics)
@@ -1,15 +1,33 @@
 import os
 from .config import _ALLOWED_EXTENSIONS
-from .tools import _execute_shell
 from .log import logger
-from . import tools
+from .matcher import LiteralScanner, PatternMatcher
+from . import rule_index, tools
+from .rule_index import TYPE_ARRAY, TYPE_DICT, TYPE_DICT_OF_DICT
+import logging
 import re
 import pathlib
 import traceback
 import inspect
+import functools
 import glob
-import yaml
+import hashlib
 import importlib
+from types import MappingProxyType
+
+
+def triggers(*literals):
+    """Decorate a global function that can only change, or log something
+    about, the files containing at least one of the literals. The function
+    is not called if no file of the module contains them, and get_files()
+    only returns these files to it. The literals are searched in the files
+    with an allowed extension."""
+
+    def decorator(function):
+        function._triggers = frozenset(literals)
+        return function
+
+    return decorator
 
 
 class BaseMigrationScript(object):
@@ -23,101 +41,131 @@ class BaseMigrationScript(object):
     _RENAMED_MODELS = []
     _REMOVED_MODELS = []
     _GLOBAL_FUNCTIONS = []  # [function_object]
+    _triggers_scanner = None  # LiteralScanner of the global functions triggers
+    _FILE_RULES = {}  # {extension: {rule_type: compiled rules}}
     _module_path = ""
+    _rules_parsed = False
+    _rules_fingerprint = ""  # hash of the rules applied on each file
+
+    # Rules used by process_file() and handle_deprecated_modules()
+    _FILE_RULES_ATTRIBUTES = (
+        "_TEXT_REPLACES",
+        "_TEXT_ERRORS",
+        "_TEXT_WARNINGS",
+        "_DEPRECATED_MODULES",
+        "_FILE_RENAMES",
+        "_REMOVED_FIELDS",
+        "_RENAMED_FIELDS",
+        "_RENAMED_MODELS",
+        "_REMOVED_MODELS",
+    )
+
+    def __getstate__(self):
+        # Read-only rules can not be pickled. They are parsed again
+        # by the process that receives the script.
+        return {}
 
     def parse_rules(self):
+        """Merge the rules defined on the class with the rules defined in
+        the yaml files and the python scripts of the migration step.
+
+        The result is stored on the instance in read-only containers, so
+        that the rules are parsed once and shared by all the migrated
+        modules, leaving the class attributes untouched.
+        """
         script_parts = inspect.getfile(self.__class__).split("/")
         migrate_from_to = script_parts[-1].split(".")[0]
         migration_scripts_dir = "/".join(script_parts[:-1])
+        cls = type(self)
 
-        TYPE_ARRAY = "TYPE_ARRAY"
-        TYPE_DICT = "TYPE_DICT"
-        TYPE_DICT_OF_DICT = "TYPE_DICT_OF_DICT"
         rules = {
             # {filetype: {regex: replacement}}
             "_TEXT_REPLACES": {
                 "type": TYPE_DICT_OF_DICT,
-                "doc": {},
+                "doc": {
+                    filetype: dict(values or {})
+                    for filetype, values in cls._TEXT_REPLACES.items()
+                },
             },
             # {filetype: {regex: message}}
             "_TEXT_ERRORS": {
                 "type": TYPE_DICT_OF_DICT,
-                "doc": {},
+                "doc": {
+                    filetype: dict(values or {})
+                    for filetype, values in cls._TEXT_ERRORS.items()
+                },
             },
             # {filetype: {regex: message}}
             "_TEXT_WARNINGS": {
                 "type": TYPE_DICT_OF_DICT,
-                "doc": {},
+                "doc": {
+                    filetype: dict(values or {})
+                    for filetype, values in cls._TEXT_WARNINGS.items()
+                },
             },
             # [(module, why, ...)]
             "_DEPRECATED_MODULES": {
                 "type": TYPE_ARRAY,
-                "doc": [],
+                "doc": list(cls._DEPRECATED_MODULES),
             },
             # {old_name: new_name}
             "_FILE_RENAMES": {
                 "type": TYPE_DICT,
-                "doc": {},
+                "doc": dict(cls._FILE_RENAMES),
             },
             # [(model_name, field_name, more_info), ...)]
             "_REMOVED_FIELDS": {
                 "type": TYPE_ARRAY,
-                "doc": [],
+                "doc": list(cls._REMOVED_FIELDS),
             },
             # [(model_name, old_field_name, new_field_name, more_info), ...)]
             "_RENAMED_FIELDS": {
                 "type": TYPE_ARRAY,
-                "doc": [],
+                "doc": list(cls._RENAMED_FIELDS),
             },
             # [(old.model.name, new.model.name, more_info)]
             "_RENAMED_MODELS": {
                 "type": TYPE_ARRAY,
-                "doc": [],
+                "doc": list(cls._RENAMED_MODELS),
             },
             # [(old.model.name, more_info)]
             "_REMOVED_MODELS": {
                 "type": TYPE_ARRAY,
-                "doc": [],
+                "doc": list(cls._REMOVED_MODELS),
             },
         }
-        # read
-        for rule in rules.keys():
-            rule_folder = rule[1:].lower()
-            file_pattern = "%s/%s/%s/*.yaml" % (
-                migration_scripts_dir,
-                rule_folder,
-                migrate_from_to,
-            )
-            for filename in glob.glob(file_pattern):
-                with open(filename) as f:
-                    new_rules = yaml.safe_load(f)
-                    if rules[rule]["type"] == TYPE_DICT_OF_DICT:
-                        for f_type, data in new_rules.items():
-                            if f_type not in rules[rule]["doc"]:
-                                rules[rule]["doc"][f_type] = {}
-                            rules[rule]["doc"][f_type].update(data)
-                    elif rules[rule]["type"] == TYPE_DICT:
-                        rules[rule]["doc"].update(new_rules)
-                    elif rules[rule]["type"] == TYPE_ARRAY:
-                        rules[rule]["doc"].extend(new_rules)
-        # extend
+        # read the rules of the yaml files, from the prebuilt index
+        step_rules = rule_index.get_step_rules(migration_scripts_dir, migrate_from_to)
+        for rule, files_rules in step_rules.items():
+            for new_rules in files_rules:
+                if rules[rule]["type"] == TYPE_DICT_OF_DICT:
+                    for f_type, data in new_rules.items():
+                        if f_type not in rules[rule]["doc"]:
+                            rules[rule]["doc"][f_type] = {}
+                        rules[rule]["doc"][f_type].update(data)
+                elif rules[rule]["type"] == TYPE_DICT:
+                    rules[rule]["doc"].update(new_rules)
+                elif rules[rule]["type"] == TYPE_ARRAY:
+                    rules[rule]["doc"].extend(new_rules)
+        # store
         for rule, data in rules.items():
             rtype = data["type"]
-            doc = data.get("doc")
-            if not doc:
-                continue
-
-            rvalues = getattr(self, rule)
+            doc = data["doc"]
             if rtype == TYPE_ARRAY:
-                rvalues.extend(doc)
+                doc = tuple(doc)
             elif rtype == TYPE_DICT:
-                rvalues.update(doc)
+                doc = MappingProxyType(doc)
             else:
                 # TYPE_DICT_OF_DICT
-                for filetype, values in doc.items():
-                    rvalues.setdefault(filetype, {})
-                    rvalues[filetype].update(values or {})
+                doc = MappingProxyType(
+                    {
+                        filetype: MappingProxyType(values)
+                        for filetype, values in doc.items()
+                    }
+                )
+            setattr(self, rule, doc)
 
+        global_functions = list(cls._GLOBAL_FUNCTIONS)
         file_pattern = "%s/python_scripts/%s/*.py" % (
             migration_scripts_dir,
             migrate_from_to,
@@ -134,7 +182,19 @@ class BaseMigrationScript(object):
             module = importlib.import_module(module_name)
             for name, value in inspect.getmembers(module, inspect.isfunction):
                 if not name.startswith("_"):
-                    self._GLOBAL_FUNCTIONS.append(value)
+                    global_functions.append(value)
+        self._GLOBAL_FUNCTIONS = tuple(global_functions)
+        self._triggers_scanner = LiteralScanner(
+            set().union(*[getattr(x, "_triggers", ()) for x in self._GLOBAL_FUNCTIONS])
+        )
+        self._compile_file_rules()
+        self._rules_fingerprint = hashlib.sha256(
+            repr(
+                [type(self).__module__]
+                + [getattr(self, rule) for rule in self._FILE_RULES_ATTRIBUTES]
+            ).encode("utf-8")
+        ).hexdigest()
+        self._rules_parsed = True
 
     def run(
         self,
@@ -144,32 +204,82 @@ class BaseMigrationScript(object):
         migration_steps,
         directory_path,
         commit_enabled,
+        cache=None,
     ):
-        logger.debug(
-            "Running %s script" % inspect.getfile(self.__class__).split("/")[-1]
-        )
-        self.parse_rules()
-        manifest_path = self._get_correct_manifest_path(
-            manifest_path, self._FILE_RENAMES
-        )
-        for root, directories, filenames in os.walk(module_path.resolve()):
-            for filename in filenames:
-                extension = os.path.splitext(filename)[1]
-                if extension not in _ALLOWED_EXTENSIONS:
-                    continue
-                self.process_file(
+        script_name = inspect.getfile(self.__class__).split("/")[-1]
+        logger.debug("Running %s script" % script_name)
+        patterns_stats = dict(tools._compiled_patterns_stats)
+        with tools._count_written_content() as written_content:
+            if not self._rules_parsed:
+                self.parse_rules()
+            manifest_path = self._get_correct_manifest_path(
+                manifest_path, self._FILE_RENAMES
+            )
+            for file_path in tools.get_files(module_path, _ALLOWED_EXTENSIONS):
+                root, filename = os.path.split(file_path)
+                process = functools.partial(
+                    self.process_file,
                     root,
                     filename,
-                    extension,
+                    file_path.suffix,
                     self._FILE_RENAMES,
                     directory_path,
                     commit_enabled,
                 )
+                if cache:
+                    cache.process_file((self,), file_path, process)
+                else:
+                    process()
+
+            self.handle_deprecated_modules(manifest_path, self._DEPRECATED_MODULES)
+
+            self._run_global_functions(
+                module_path, module_name, manifest_path, migration_steps
+            )
+        logger.debug(
+            "%s script changed %d files (%d bytes)"
+            % (script_name, len(written_content["files"]), written_content["bytes"])
+        )
+        tools._log_compiled_patterns_stats(patterns_stats)
+
+    def _run_global_functions(
+        self, module_path, module_name, manifest_path, migration_steps
+    ):
+        for function in self._GLOBAL_FUNCTIONS:
+            function_triggers = getattr(function, "_triggers", None)
+            files_filter = None
+            if function_triggers is not None:
+                # The files are scanned once for the triggers of all the
+                # functions, and again only if they changed
+                file_paths = {
+                    str(x)
+                    for x in tools.get_files(module_path, _ALLOWED_EXTENSIONS)
+                    if not function_triggers.isdisjoint(
+                        tools._get_file_literals(x, self._triggers_scanner)
+                    )
+                }
+                if not file_paths:
+                    logger.debug(
+                        "Skipping %s: no file contains %s"
+                        % (function.__name__, ", ".join(sorted(function_triggers)))
+                    )
+                    continue
+                logger.debug(
+                    "Running %s on %d files containing %s"
+                    % (
+                        function.__name__,
+                        len(file_paths),
+                        ", ".join(sorted(function_triggers)),
+                    )
+                )
 
-        self.handle_deprecated_modules(manifest_path, self._DEPRECATED_MODULES)
+                def files_filter(file_path, file_paths=file_paths):
+                    if str(file_path) in file_paths:
+                        return True
+                    logger.debug("Skipping %s for %s" % (function.__name__, file_path))
+                    return False
 
-        if self._GLOBAL_FUNCTIONS:
-            for function in self._GLOBAL_FUNCTIONS:
+            with tools._filter_files(files_filter):
                 function(
                     logger=logger,
                     module_path=module_path,
@@ -182,6 +292,8 @@ class BaseMigrationScript(object):
     def process_file(
         self, root, filename, extension, file_renames, directory_path, commit_enabled
     ):
+        """Rename the file, apply the text replaces and log the text errors
+        and warnings. Return the path of the file, once renamed."""
         # Skip useless file
         # TODO, skip files present in some folders. (for exemple 'lib')
         absolute_file_path = os.path.join(root, filename)
@@ -198,40 +310,93 @@ class BaseMigrationScript(object):
             )
             absolute_file_path = os.path.join(root, new_name)
 
+        file_rules = self._FILE_RULES[extension]
+
+        # Operate changes in the file (replacements, removals)
+        new_text = tools._replace_in_file(
+            absolute_file_path,
+            file_rules["replaces"],
+            "Change file content of %s" % filename,
+        )
+
+        # Display errors and warnings if the new content contains some
+        # obsolete pattern
+        for (level, message, __), __ in file_rules["checks"].search(new_text):
+            if level == logging.ERROR:
+                logger.error(message + "\nFile " + os.path.join(root, filename))
+            else:
+                logger.warning(message + ". File " + root + os.sep + filename)
+        return absolute_file_path
+
+    def _compile_file_rules(self):
+        """Expand the rules applied on each file into tables of compiled
+        patterns, one by allowed file extension:
+        {extension: {
+            'replaces': {pattern: replacement},
+            'checks': PatternMatcher of (pattern, (log level, message, rule id)),
+        }}
+        The rule id of a check is made of the name of the script, the kind
+        of rule that defines it, and a hash of its pattern.
+        """
         removed_fields = self.handle_removed_fields(self._REMOVED_FIELDS)
         renamed_fields = self.handle_renamed_fields(self._RENAMED_FIELDS)
         renamed_models = self.handle_renamed_models(self._RENAMED_MODELS)
         removed_models = self.handle_removed_models(self._REMOVED_MODELS)
+        script_name = type(self).__module__.split(".")[-1]
 
-        # Operate changes in the file (replacements, removals)
-        replaces = self._TEXT_REPLACES.get("*", {})
-        replaces.update(self._TEXT_REPLACES.get(extension, {}))
-        replaces.update(renamed_models.get("replaces"))
-        replaces.update(removed_models.get("replaces"))
+        def get_rule_id(kind, pattern):
+            return "%s/%s/%s" % (
+                script_name,
+                kind,
+                hashlib.sha1(pattern.encode("utf-8")).hexdigest()[:8],
+            )
 
-        new_text = tools._replace_in_file(
-            absolute_file_path, replaces, "Change file content of %s" % filename
-        )
+        file_rules = {}
+        for extension in _ALLOWED_EXTENSIONS:
+            replaces = dict(self._TEXT_REPLACES.get("*", {}))
+            replaces.update(self._TEXT_REPLACES.get(extension, {}))
+            replaces.update(renamed_models.get("replaces"))
+            replaces.update(removed_models.get("replaces"))
+
+            # {pattern: (message, kind of rule)}
+            errors = {}
+            for kind, rules in (
+                ("text_errors", self._TEXT_ERRORS.get("*", {})),
+                ("text_errors", self._TEXT_ERRORS.get(extension, {})),
+                ("renamed_models", renamed_models.get("errors")),
+                ("removed_models", removed_models.get("errors")),
+            ):
+                errors.update({k: (v, kind) for k, v in rules.items()})
+
+            warnings = {}
+            for kind, rules in (
+                ("text_warnings", self._TEXT_WARNINGS.get("*", {})),
+                ("text_warnings", self._TEXT_WARNINGS.get(extension, {})),
+                ("removed_fields", removed_fields.get("warnings")),
+                ("renamed_fields", renamed_fields.get("warnings")),
+                ("renamed_models", renamed_models.get("warnings")),
+                ("removed_models", removed_models.get("warnings")),
+            ):
+                warnings.update({k: (v, kind) for k, v in rules.items()})
 
-        # Display errors if the new content contains some obsolete
-        # pattern
-        errors = self._TEXT_ERRORS.get("*", {})
-        errors.update(self._TEXT_ERRORS.get(extension, {}))
-        errors.update(renamed_models.get("errors"))
-        errors.update(removed_models.get("errors"))
-        for pattern, error_message in errors.items():
-            if re.findall(pattern, new_text):
-                logger.error(error_message + "\nFile " + os.path.join(root, filename))
-
-        warnings = self._TEXT_WARNINGS.get("*", {})
-        warnings.update(self._TEXT_WARNINGS.get(extension, {}))
-        warnings.update(removed_fields.get("warnings"))
-        warnings.update(renamed_fields.get("warnings"))
-        warnings.update(renamed_models.get("warnings"))
-        warnings.update(removed_models.get("warnings"))
-        for pattern, warning_message in warnings.items():
-            if re.findall(pattern, new_text):
-                logger.warning(warning_message + ". File " + root + os.sep + filename)
+            file_rules[extension] = MappingProxyType(
+                {
+                    "replaces": MappingProxyType(
+                        {tools._compile_pattern(k): v for k, v in replaces.items()}
+                    ),
+                    "checks": PatternMatcher(
+                        [
+                            (k, (logging.ERROR, v, get_rule_id(kind, k)))
+                            for k, (v, kind) in errors.items()
+                        ]
+                        + [
+                            (k, (logging.WARNING, v, get_rule_id(kind, k)))
+                            for k, (v, kind) in warnings.items()
+                        ]
+                    ),
+                }
+            )
+        self._FILE_RULES = MappingProxyType(file_rules)
 
     def handle_removed_fields(self, removed_fields):
         """Give warnings if field_name is found on the code. To minimize two
@@ -329,7 +494,7 @@ class BaseMigrationScript(object):
                         % (old_module, new_module, old_module)
                     )
         if current_manifest_text != new_manifest_text:
-            tools._write_content(manifest_path, new_manifest_text)
+            tools._update_content(manifest_path, new_manifest_text)
 
     def handle_renamed_models(self, renamed_models):
         """renamed_models = [(old.model, new.model, msg)]
@@ -434,25 +599,18 @@ class BaseMigrationScript(object):
 
     def _rename_file(self, module_path, old_file_path, new_file_path, commit_enabled):
         """
-        Rename a file. try to execute 'git mv', to avoid huge diff.
-
-        if 'git mv' fails, make a classical rename
+        Rename a file. In a module migration, the file is moved when the
+        module files are written, and the rename is staged if commit is
+        enabled, to avoid huge diff.
         """
         logger.info(
             "Renaming file: '%s' by '%s' "
             % (
-                old_file_path.replace(str(module_path.resolve()), ""),
-                new_file_path.replace(str(module_path.resolve()), ""),
+                old_file_path.replace(str(module_path), ""),
+                new_file_path.replace(str(module_path), ""),
             )
         )
         try:
-            if commit_enabled:
-                _execute_shell(
-                    "git mv %s %s" % (old_file_path, new_file_path), path=module_path
-                )
-            else:
-                _execute_shell(
-                    "mv %s %s" % (old_file_path, new_file_path), path=module_path
-                )
-        except BaseException:
+            tools._rename_path(old_file_path, new_file_path)
+        except OSError:
             logger.error(traceback.format_exc())
@@ -0,0 +1,117 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import hashlib
+import json
+import os
+import tempfile
+
+from . import tools
+from .log import logger, LogRecordCollector
+
+_CACHE_DIRECTORY = ".odoo_module_migrate_cache"
+
+# Increase it when the way the files are processed changes, so that the
+# existing entries are not used anymore.
+_CACHE_VERSION = 1
+
+
+class MigrationCache:
+    """On-disk cache of the changes done on each file by migration scripts.
+
+    An entry is keyed by the path and the content of the file, the version
+    range of the migration and the fingerprint of the rules of the
+    migration scripts. It contains the new path and content of the file,
+    and the messages logged while processing it, that are logged again
+    when the entry is used.
+    """
+
+    def __init__(self, directory_path, migration_steps):
+        self._path = os.path.join(str(directory_path), _CACHE_DIRECTORY)
+        self._version_range = "%s-%s" % (
+            migration_steps[0]["init_version_name"],
+            migration_steps[-1]["target_version_name"],
+        )
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _get_key(self, migration_scripts, file_path, content):
+        key = hashlib.sha256()
+        for value in [
+            str(_CACHE_VERSION),
+            self._version_range,
+            file_path,
+            *[x._rules_fingerprint for x in migration_scripts],
+            content,
+        ]:
+            key.update(value.encode("utf-8"))
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def _get_entry_path(self, key):
+        return os.path.join(self._path, key[:2], key + ".json")
+
+    def _read_entry(self, entry_path):
+        try:
+            with open(entry_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, entry_path, entry):
+        try:
+            if not os.path.exists(self._path):
+                os.makedirs(self._path, exist_ok=True)
+                # The cache must not be committed with the migrated modules
+                with open(os.path.join(self._path, ".gitignore"), "w") as f:
+                    f.write("*\n")
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            # Write in a temporary file first, as modules can be migrated
+            # in parallel
+            with tempfile.NamedTemporaryFile(
+                "w", dir=os.path.dirname(entry_path), delete=False
+            ) as f:
+                json.dump(entry, f)
+            os.replace(f.name, entry_path)
+        except OSError as e:
+            logger.debug("Unable to write cache entry %s: %s" % (entry_path, e))
+
+    def process_file(self, migration_scripts, file_path, process):
+        """Process a file with migration scripts, or apply the changes found
+        in the cache. process() makes the changes and returns the new path
+        of the file. Return the new path of the file."""
+        file_path = str(file_path)
+        content = tools._read_content(file_path)
+        entry_path = self._get_entry_path(
+            self._get_key(migration_scripts, file_path, content)
+        )
+        entry = self._read_entry(entry_path)
+        if entry is not None:
+            self._stats["hits"] += 1
+            new_file_path = entry["path"]
+            if new_file_path != file_path:
+                tools._rename_path(file_path, new_file_path)
+            if entry["content"] is not None:
+                tools._update_content(new_file_path, entry["content"])
+            for level, message in entry["records"]:
+                logger.log(level, message)
+            return new_file_path
+
+        self._stats["misses"] += 1
+        collector = LogRecordCollector()
+        logger.addHandler(collector)
+        try:
+            new_file_path = str(process())
+        finally:
+            logger.removeHandler(collector)
+        new_content = tools._read_content(new_file_path)
+        self._write_entry(
+            entry_path,
+            {
+                "path": new_file_path,
+                "content": new_content if new_content != content else None,
+                "records": [[x.levelno, x.getMessage()] for x in collector.records],
+            },
+        )
+        return new_file_path
+
+    def _log_stats(self):
+        logger.debug("Migration cache: %(hits)d hits, %(misses)d misses" % self._stats)
@@ -0,0 +1,205 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import bisect
+import json
+import logging
+import os
+import re
+
+from .config import _ALLOWED_EXTENSIONS
+from .log import logger
+from .migration import Migration
+
+_LEVEL_NAMES = {logging.ERROR: "error", logging.WARNING: "warning"}
+
+# Number of files sent at once to a worker process
+_CHUNK_SIZE = 64
+
+_SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+
+class Check:
+    """Search in the files of modules the patterns that the migration
+    scripts report as errors or warnings (text errors and warnings, removed
+    and renamed fields and models), without changing anything.
+
+    Patterns are searched in the current content of the files: the text
+    replaces of the migration are not applied first.
+    """
+
+    def __init__(
+        self,
+        relative_directory_path,
+        init_version_name,
+        target_version_name,
+        module_names=None,
+        jobs=1,
+    ):
+        # The migration is only used to find the modules and to load the
+        # migration scripts. It does not run pre-commit nor git commands.
+        migration = Migration(
+            relative_directory_path,
+            init_version_name,
+            target_version_name,
+            module_names,
+            commit_enabled=False,
+            pre_commit=False,
+            remove_migration_folder=False,
+        )
+        self._jobs = jobs
+        self._directory_path = migration._directory_path
+        self._module_names = [x._module_name for x in migration._module_migrations]
+        self._migration_scripts = [
+            x
+            for x in migration._migration_scripts
+            if any(len(rules["checks"]) for rules in x._FILE_RULES.values())
+        ]
+
+    def _get_file_paths(self):
+        file_paths = []
+        for module_name in self._module_names:
+            for root, __, filenames in os.walk(self._directory_path / module_name):
+                file_paths += [
+                    os.path.join(root, filename)
+                    for filename in sorted(filenames)
+                    if os.path.splitext(filename)[1] in _ALLOWED_EXTENSIONS
+                ]
+        return file_paths
+
+    def run(self):
+        """Return the list of the findings, sorted by file and position.
+        A finding is a dictionary with the keys file (relative to the
+        directory), line, column, rule_id, level ('error' or 'warning')
+        and message."""
+        file_paths = self._get_file_paths()
+        if self._jobs == 1 or len(file_paths) <= _CHUNK_SIZE:
+            results = [_check_file(self._migration_scripts, x) for x in file_paths]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(
+                max_workers=self._jobs,
+                initializer=_init_worker,
+                initargs=(self._migration_scripts, logger.level),
+            ) as executor:
+                results = list(
+                    executor.map(_check_worker_file, file_paths, chunksize=_CHUNK_SIZE)
+                )
+        findings = []
+        for file_path, file_findings in zip(file_paths, results):
+            relative_path = os.path.relpath(file_path, self._directory_path)
+            findings += [dict(file=relative_path, **x) for x in file_findings]
+        findings.sort(key=lambda x: (x["file"], x["line"], x["column"], x["rule_id"]))
+        logger.debug("%d findings in %d files" % (len(findings), len(file_paths)))
+        return findings
+
+
+def _check_file(migration_scripts, file_path):
+    try:
+        with open(file_path, "r") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning("Unable to read %s: %s" % (file_path, e))
+        return []
+    extension = os.path.splitext(file_path)[1]
+    line_starts = None
+    findings = []
+    for migration_script in migration_scripts:
+        checks = migration_script._FILE_RULES[extension]["checks"]
+        for (level, message, rule_id), first_match in checks.search(text):
+            if line_starts is None:
+                line_starts = [0] + [x.end() for x in re.finditer("\n", text)]
+            for match in first_match.re.finditer(text, first_match.start()):
+                line = bisect.bisect_right(line_starts, match.start())
+                findings.append(
+                    {
+                        "line": line,
+                        "column": match.start() - line_starts[line - 1] + 1,
+                        "rule_id": rule_id,
+                        "level": _LEVEL_NAMES[level],
+                        "message": message,
+                    }
+                )
+    return findings
+
+
+_worker_migration_scripts = ()
+
+
+def _init_worker(migration_scripts, log_level):
+    global _worker_migration_scripts
+    # Rules are not pickled with the scripts
+    for migration_script in migration_scripts:
+        if not migration_script._rules_parsed:
+            migration_script.parse_rules()
+    _worker_migration_scripts = migration_scripts
+    logger.setLevel(log_level)
+
+
+def _check_worker_file(file_path):
+    return _check_file(_worker_migration_scripts, file_path)
+
+
+def to_json(findings):
+    return json.dumps(findings, indent=2)
+
+
+def to_sarif(findings):
+    """Return the findings as a SARIF 2.1.0 log"""
+    rule_indexes = {}
+    rules = []
+    results = []
+    for finding in findings:
+        rule_id = finding["rule_id"]
+        if rule_id not in rule_indexes:
+            rule_indexes[rule_id] = len(rules)
+            rules.append(
+                {
+                    "id": rule_id,
+                    "shortDescription": {"text": finding["message"]},
+                    "defaultConfiguration": {"level": finding["level"]},
+                }
+            )
+        results.append(
+            {
+                "ruleId": rule_id,
+                "ruleIndex": rule_indexes[rule_id],
+                "level": finding["level"],
+                "message": {"text": finding["message"]},
+                "locations": [
+                    {
+                        "physicalLocation": {
+                            "artifactLocation": {
+                                "uri": finding["file"].replace(os.sep, "/"),
+                                "uriBaseId": "%SRCROOT%",
+                            },
+                            "region": {
+                                "startLine": finding["line"],
+                                "startColumn": finding["column"],
+                            },
+                        }
+                    }
+                ],
+            }
+        )
+    return json.dumps(
+        {
+            "$schema": _SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": "odoo-module-migrator",
+                            "informationUri": (
+                                "https://github.com/OCA/odoo-module-migrator"
+                            ),
+                            "rules": rules,
+                        }
+                    },
+                    "results": results,
+                }
+            ],
+        },
+        indent=2,
+    )
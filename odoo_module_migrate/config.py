@@ -80,3 +80,25 @@ _AVAILABLE_MIGRATION_STEPS = [
 _ALLOWED_EXTENSIONS = [".py", ".xml", ".js", ".csv"]
 
 _MANIFEST_NAMES = ["__openerp__.py", "__manifest__.py"]
+
+# Modules of the migration scripts, in the order they are run. The scripts
+# to run are selected from this list by their name, and only them are
+# imported. Add the new scripts here.
+_MIGRATION_SCRIPTS = [
+    "migrate_080_090",
+    "migrate_080_allways",
+    "migrate_090_100",
+    "migrate_100_110",
+    "migrate_100_allways",
+    "migrate_110_120",
+    "migrate_120_130",
+    "migrate_130_140",
+    "migrate_140_150",
+    "migrate_150_160",
+    "migrate_150_allways",
+    "migrate_160_170",
+    "migrate_170_180",
+    "migrate_180_190",
+    "migrate_allways",
+    "migrate_remove_migration_folder",
+]
@@ -0,0 +1,398 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+import difflib
+import hashlib
+import itertools
+import os
+import pathlib
+import re
+import shutil
+import traceback
+import zlib
+
+from .log import logger
+from .tools import _git_update_index
+
+# End of the lines, for git: unlike str.splitlines(), only on "\n"
+_LINE_END_RE = re.compile(r"(?<=\n)(?=.)", re.DOTALL)
+
+
+def _git_diff(old_name, new_name, old_content, new_content, mode):
+    """Return the changes of a file in the format of 'git diff'. old_name
+    is None for a new file, new_name is None for a removed file."""
+    lines = ["diff --git a/%s b/%s\n" % (old_name or new_name, new_name or old_name)]
+    if old_name is None:
+        lines.append("new file mode %s\n" % mode)
+    elif new_name is None:
+        lines.append("deleted file mode %s\n" % mode)
+    elif old_name != new_name:
+        lines += ["rename from %s\n" % old_name, "rename to %s\n" % new_name]
+    if old_content != new_content:
+        lines += [
+            "--- %s\n" % (old_name and "a/" + old_name or "/dev/null"),
+            "+++ %s\n" % (new_name and "b/" + new_name or "/dev/null"),
+        ]
+        diff_lines = difflib.unified_diff(
+            _LINE_END_RE.split(old_content) if old_content else [],
+            _LINE_END_RE.split(new_content) if new_content else [],
+        )
+        # Skip the file names, already written
+        for line in itertools.islice(diff_lines, 2, None):
+            lines.append(line)
+            if not line.endswith("\n"):
+                lines.append("\n\\ No newline at end of file\n")
+    return "".join(lines)
+
+
+def _git_binary_literal(data):
+    """Return the 'literal' section of a git binary patch: the compressed
+    data encoded in base85, by lines of 52 bytes starting with the length
+    of the line."""
+    lines = ["literal %d\n" % len(data)]
+    compressed = zlib.compress(data)
+    for i in range(0, len(compressed), 52):
+        chunk = compressed[i : i + 52]
+        length = len(chunk)
+        if length <= 26:
+            length_char = chr(ord("A") + length - 1)
+        else:
+            length_char = chr(ord("a") + length - 27)
+        lines.append(
+            "%s%s\n" % (length_char, base64.b85encode(chunk, pad=True).decode())
+        )
+    lines.append("\n")
+    return "".join(lines)
+
+
+def _git_diff_removed_binary(old_name, old_data, mode):
+    """Return the removal of a binary file, in the format of
+    'git diff --binary', that 'git apply' can apply."""
+    blob_hash = hashlib.sha1(b"blob %d\0" % len(old_data) + old_data).hexdigest()
+    return "".join(
+        [
+            "diff --git a/%s b/%s\n" % (old_name, old_name),
+            "deleted file mode %s\n" % mode,
+            "index %s..%s\n" % (blob_hash, "0" * 40),
+            "GIT binary patch\n",
+            # The new content, then the old one, to reverse the patch
+            _git_binary_literal(b""),
+            _git_binary_literal(old_data),
+        ]
+    )
+
+
+class FileBuffer:
+    """In-memory copy of the files of a module.
+
+    The module directory is walked once, and each file is read from disk
+    the first time its content is requested. Migration scripts read and
+    write files, rename them or remove folders through ``tools``, that
+    redirect these operations to the active buffer. Changes are applied
+    on disk by ``flush()``, writing each changed file once.
+
+    If contents ({absolute path: content}) are given, the buffer only
+    works in memory: the module is not read from disk, and the buffer is
+    not flushed.
+    """
+
+    def __init__(self, module_path, contents=None):
+        module_path = pathlib.Path(module_path)
+        self._path = module_path
+        self.in_memory = contents is not None
+        self._unresolved_root = os.path.abspath(str(module_path))
+        if self.in_memory:
+            self._root = self._unresolved_root
+        else:
+            self._root = str(module_path.resolve())
+        # {path: path of the file on disk}, in the order of the walk
+        self._files = {}
+        # {path: content}
+        self._contents = {}
+        # {path on disk: content read from disk}
+        self._disk_contents = {}
+        self._removed_paths = []
+        # {(path, kind): object parsed from the content of the file}
+        self._parsed = {}
+        # {path: kind of the changed parsed object the content is to be
+        # serialized from}. See write_parsed()
+        self._pending_parsed = {}
+        if self.in_memory:
+            for path, content in contents.items():
+                path = self._key(path)
+                self._files[path] = path
+                self._disk_contents[path] = self._contents[path] = content
+            return
+        for root, __, filenames in os.walk(self._root):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                self._files[path] = path
+
+    def _key(self, path):
+        path = os.path.abspath(str(path))
+        root = self._unresolved_root
+        if root != self._root and (path == root or path.startswith(root + os.sep)):
+            path = self._root + path[len(root) :]
+        return path
+
+    def handles(self, path):
+        """Return True if path is located in the module directory"""
+        path = self._key(path)
+        return path == self._root or path.startswith(self._root + os.sep)
+
+    def exists(self, path):
+        path = self._key(path)
+        if path in self._files:
+            return True
+        prefix = path + os.sep
+        return any(x.startswith(prefix) for x in self._files)
+
+    def get_files(self, extensions):
+        return [
+            pathlib.Path(path)
+            for path in self._files
+            if os.path.splitext(path)[1] in extensions
+        ]
+
+    def read(self, path):
+        path = self._key(path)
+        self._serialize_parsed(path)
+        if path not in self._contents:
+            if self.in_memory:
+                raise FileNotFoundError(path)
+            disk_path = self._files.get(path, path)
+            with open(disk_path, "r") as f:
+                content = f.read()
+            self._disk_contents[disk_path] = content
+            self._contents[path] = content
+            self._files.setdefault(path, path)
+        return self._contents[path]
+
+    def get_parsed(self, path, kind):
+        """Return the object of the given kind stored for the file by
+        set_parsed(). The caller checks it matches the file content."""
+        return self._parsed.get((self._key(path), kind))
+
+    def set_parsed(self, path, kind, value):
+        self._parsed[(self._key(path), kind)] = value
+
+    def write_parsed(self, path, kind, value):
+        """Store a changed object parsed from the file. The content of the
+        file is value.serialize(), called once, the next time the content
+        is requested."""
+        path = self._key(path)
+        self._files.setdefault(path, None)
+        self._parsed[(path, kind)] = value
+        self._pending_parsed[path] = kind
+
+    def _serialize_parsed(self, path=None):
+        """Set the content of the file (or of all the files) from the
+        changed parsed object stored by write_parsed()"""
+        paths = [path] if path else list(self._pending_parsed)
+        for path in paths:
+            kind = self._pending_parsed.pop(path, None)
+            if kind:
+                self._contents[path] = self._parsed[(path, kind)].serialize()
+
+    def write(self, path, content):
+        path = self._key(path)
+        self._files.setdefault(path, None)
+        self._contents[path] = content
+        # The changes done on the parsed object are overwritten
+        kind = self._pending_parsed.pop(path, None)
+        if kind:
+            del self._parsed[(path, kind)]
+
+    def rename(self, old_path, new_path):
+        old_path, new_path = self._key(old_path), self._key(new_path)
+        self._files[new_path] = self._files.pop(old_path)
+        if old_path in self._contents:
+            self._contents[new_path] = self._contents.pop(old_path)
+        if old_path in self._pending_parsed:
+            self._pending_parsed[new_path] = self._pending_parsed.pop(old_path)
+        for key in [x for x in self._parsed if x[0] == old_path]:
+            self._parsed[(new_path, key[1])] = self._parsed.pop(key)
+
+    def remove(self, path):
+        """Remove a file or a folder"""
+        path = self._key(path)
+        prefix = path + os.sep
+        for key in [x for x in self._files if x == path or x.startswith(prefix)]:
+            del self._files[key]
+            self._contents.pop(key, None)
+        for key in [x for x in self._parsed if x[0] == path or x[0].startswith(prefix)]:
+            del self._parsed[key]
+        for key in [
+            x for x in self._pending_parsed if x == path or x.startswith(prefix)
+        ]:
+            del self._pending_parsed[key]
+        self._removed_paths.append(path)
+
+    def get_contents(self):
+        """Return {path: content} of the files of the module. Files that
+        have not been read yet are read from disk."""
+        return {path: self.read(path) for path in self._files}
+
+    def get_renames(self):
+        """Return {old path: new path} of the files renamed"""
+        return {
+            disk_path: path
+            for path, disk_path in self._files.items()
+            if disk_path is not None and disk_path != path
+        }
+
+    def _read_disk(self, disk_path):
+        if disk_path not in self._disk_contents:
+            with open(disk_path, "r") as f:
+                self._disk_contents[disk_path] = f.read()
+        return self._disk_contents[disk_path]
+
+    def diff(self, base_path):
+        """Return the changes not written on disk, in the format of
+        'git diff', with paths relative to base_path."""
+        base_path = str(pathlib.Path(base_path).resolve())
+        self._serialize_parsed()
+
+        def get_mode(disk_path):
+            return os.access(disk_path, os.X_OK) and "100755" or "100644"
+
+        result = []
+        for path, disk_path in self._files.items():
+            new_content = self._contents.get(path)
+            if new_content is None:
+                # Unchanged file, not read (binary files are never read)
+                if disk_path == path:
+                    continue
+                result.append(
+                    _git_diff(
+                        os.path.relpath(disk_path, base_path),
+                        os.path.relpath(path, base_path),
+                        None,
+                        None,
+                        get_mode(disk_path),
+                    )
+                )
+                continue
+            if disk_path is None:
+                result.append(
+                    _git_diff(
+                        None,
+                        os.path.relpath(path, base_path),
+                        "",
+                        new_content,
+                        "100644",
+                    )
+                )
+                continue
+            if disk_path == path and new_content == self._read_disk(disk_path):
+                continue
+            # The diff applies on the file as it is on disk, with its line
+            # endings, that reading the file in text mode converts
+            with open(disk_path, "r", newline="") as f:
+                old_content = f.read()
+            result.append(
+                _git_diff(
+                    os.path.relpath(disk_path, base_path),
+                    os.path.relpath(path, base_path),
+                    old_content,
+                    new_content,
+                    get_mode(disk_path),
+                )
+            )
+
+        kept_disk_paths = set(self._files.values())
+        for removed_path in self._removed_paths:
+            if os.path.isfile(removed_path):
+                disk_paths = [removed_path]
+            else:
+                disk_paths = [
+                    os.path.join(root, filename)
+                    for root, __, filenames in os.walk(removed_path)
+                    for filename in filenames
+                ]
+            for disk_path in disk_paths:
+                if disk_path in kept_disk_paths:
+                    continue
+                # Removed folders may contain binary files (*.pyc, ...)
+                with open(disk_path, "rb") as f:
+                    old_data = f.read()
+                try:
+                    old_content = old_data.decode("utf-8")
+                except UnicodeDecodeError:
+                    result.append(
+                        _git_diff_removed_binary(
+                            os.path.relpath(disk_path, base_path),
+                            old_data,
+                            get_mode(disk_path),
+                        )
+                    )
+                    continue
+                result.append(
+                    _git_diff(
+                        os.path.relpath(disk_path, base_path),
+                        None,
+                        old_content,
+                        "",
+                        get_mode(disk_path),
+                    )
+                )
+        return "".join(result)
+
+    def flush(self, git_enabled):
+        """Write changes on disk. If git_enabled is True, renamed and
+        removed files are staged with a single git command, as 'git mv'
+        and 'git rm' would do. Return the list of the paths changed on
+        disk: written, renamed or removed."""
+        self._serialize_parsed()
+        staged_paths = []
+        for path, disk_path in self._files.items():
+            if disk_path is None or disk_path == path:
+                continue
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.rename(disk_path, path)
+            except OSError:
+                logger.error(traceback.format_exc())
+                continue
+            staged_paths += [disk_path, path]
+            self._files[path] = path
+            if disk_path in self._disk_contents:
+                self._disk_contents[path] = self._disk_contents.pop(disk_path)
+
+        for path in self._removed_paths:
+            if os.path.isdir(path):
+                staged_paths += [
+                    os.path.join(root, filename)
+                    for root, __, filenames in os.walk(path)
+                    for filename in filenames
+                ]
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                staged_paths.append(path)
+                os.remove(path)
+        self._removed_paths = []
+
+        if git_enabled and staged_paths:
+            try:
+                _git_update_index(self._root, staged_paths)
+            except BaseException:
+                logger.error(traceback.format_exc())
+
+        written_files = []
+        written_bytes = 0
+        for path, content in self._contents.items():
+            disk_path = self._files[path]
+            if disk_path is not None and self._disk_contents.get(disk_path) == content:
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+            self._files[path] = path
+            self._disk_contents[path] = content
+            written_files.append(path)
+            written_bytes += len(content.encode("utf-8"))
+        logger.debug(
+            "%d files (%d bytes) written in %s"
+            % (len(written_files), written_bytes, self._path)
+        )
+        return staged_paths + written_files
@@ -37,6 +37,25 @@ def setup_logger(level, file_path=False):
     logger.setLevel(getattr(logging, str(level)))
 
 
+class LogRecordCollector(logging.Handler):
+    """Keep log records in memory, so that they can be sent to another
+    process and replayed there, with ``logger.handle(record)``."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Render the message now: arguments and tracebacks are not
+        # always picklable.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
 class OdooMigrateFormatter(logging.Formatter):
     def format(self, record):
         """Overwrite format() function to use custom formatter"""
@@ -0,0 +1,158 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+_REPEATS = tuple(
+    getattr(sre_parse, name)
+    for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    if hasattr(sre_parse, name)
+)
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+
+def _required_literals(items):
+    """Return a set of strings such that any text matched by the parsed
+    pattern ``items`` contains at least one of them, or None if no such
+    set can be found."""
+    candidates = []
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append({"".join(run)})
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            __, add_flags, __, sub_items = av
+            if not add_flags & re.IGNORECASE:
+                candidates.append(_required_literals(sub_items))
+        elif op is _ATOMIC_GROUP:
+            candidates.append(_required_literals(av))
+        elif op in _REPEATS:
+            min_repeat, __, sub_items = av
+            if min_repeat >= 1:
+                candidates.append(_required_literals(sub_items))
+        elif op is sre_parse.BRANCH:
+            alternatives = [_required_literals(x) for x in av[1]]
+            if all(alternatives):
+                candidates.append(set().union(*alternatives))
+    if run:
+        candidates.append({"".join(run)})
+    candidates = [x for x in candidates if x]
+    if not candidates:
+        return None
+    # The longer the shortest literal, the more selective the set
+    return max(candidates, key=lambda x: min(len(literal) for literal in x))
+
+
+def _pattern_literals(pattern):
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    return _required_literals(parsed)
+
+
+def _trie_regex(literals):
+    """Return a regular expression matching the given literals, factorized
+    as a trie, so that the regex engine tests each character once."""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        alternatives = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1:
+            body = alternatives[0]
+        else:
+            body = "(?:%s)" % "|".join(alternatives)
+        if "" in node:
+            body = "(?:%s)?" % body
+        return body
+
+    return build(trie)
+
+
+class LiteralScanner:
+    """Find which literals of a set are found in a text, scanning the text
+    once for all of them."""
+
+    def __init__(self, literals):
+        self.literals = frozenset(literals)
+        self._regex = (
+            self.literals
+            and re.compile("(?=(%s))" % _trie_regex(self.literals))
+            or None
+        )
+        # The scan returns the longest literal found at each position. The
+        # shorter literals found at the same position are its prefixes.
+        self._found_literals = {
+            literal: {
+                literal[:i]
+                for i in range(1, len(literal) + 1)
+                if literal[:i] in self.literals
+            }
+            for literal in self.literals
+        }
+
+    def scan(self, text):
+        """Return the set of the literals found in the text"""
+        found = set()
+        if self._regex:
+            for literal in set(self._regex.findall(text)):
+                found |= self._found_literals[literal]
+        return found
+
+
+class PatternMatcher:
+    """Find which patterns of a list of rules are found in a text.
+
+    The text is scanned once for all the literals required by the patterns,
+    then only the patterns whose literals are present are searched.
+    Patterns without required literal (ignore case, only char classes, ...)
+    are always searched.
+    """
+
+    def __init__(self, rules):
+        """:param rules: iterable of (pattern, value)"""
+        self._rules = tuple((re.compile(pattern), value) for pattern, value in rules)
+        self._rule_literals = tuple(
+            _pattern_literals(pattern) for pattern, __ in self._rules
+        )
+        self._scanner = LiteralScanner(
+            set().union(*[x for x in self._rule_literals if x])
+        )
+
+    def __len__(self):
+        return len(self._rules)
+
+    def search(self, text):
+        """Return [(value, match)] for each rule whose pattern is found in
+        the text, in the order of the rules. match is the first match of
+        the pattern."""
+        found = self._scanner.scan(text)
+        result = []
+        for (pattern, value), literals in zip(self._rules, self._rule_literals):
+            if literals is not None and found.isdisjoint(literals):
+                continue
+            match = pattern.search(text)
+            if match:
+                result.append((value, match))
+        return result
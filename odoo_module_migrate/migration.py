@@ -5,15 +5,23 @@
 import importlib
 import os
 import pathlib
-import pkgutil
 import inspect
+import shlex
+import subprocess
+import sys
+import time
 
-from .config import _AVAILABLE_MIGRATION_STEPS, _MANIFEST_NAMES
+from .config import _AVAILABLE_MIGRATION_STEPS, _MANIFEST_NAMES, _MIGRATION_SCRIPTS
 from .exception import ConfigException
-from .log import logger
+from .log import logger, LogRecordCollector
 from .tools import _execute_shell, _get_latest_version_code
 from .module_migration import ModuleMigration
 from .base_migration_script import BaseMigrationScript
+from .cache import MigrationCache
+
+# Maximum length of the file paths given to one pre-commit command, far
+# below the limit of the arguments of a command (ARG_MAX)
+_MAX_FILE_ARGUMENTS_LENGTH = 64 * 1024
 
 
 class Migration:
@@ -28,9 +36,38 @@ class Migration:
         commit_enabled=True,
         pre_commit=True,
         remove_migration_folder=True,
+        jobs=1,
+        fused=False,
+        cache=False,
+        dry_run=False,
+        files=None,
     ):
+        """files: if set, {path relative to the directory: content} of the
+        files of the modules, that are migrated in memory, without reading
+        or writing anything on disk. The migrated files are then available
+        in the file buffers of the module migrations."""
         if not module_names:
             module_names = []
+        if jobs < 1:
+            raise ConfigException("The number of jobs must be at least 1")
+        if format_patch and dry_run:
+            raise ConfigException("Format patch option can not be used in dry-run mode")
+        if cache and dry_run:
+            # The cache is written in the directory, that must not change
+            raise ConfigException("Cache option can not be used in dry-run mode")
+        if files is not None and (format_patch or dry_run or cache or jobs != 1):
+            raise ConfigException(
+                "Format patch, dry-run, cache and jobs options can not be used"
+                " to migrate files in memory"
+            )
+        self._jobs = jobs
+        # False, or the path of the file where the diff is written ('-' for
+        # the standard output). In dry-run mode, nothing is changed on disk
+        self._dry_run = dry_run
+        if dry_run or files is not None:
+            commit_enabled = pre_commit = False
+        self._fused = fused
+        self._cache = None
         self._commit_enabled = commit_enabled
         self._pre_commit = pre_commit
         self._remove_migration_folder = remove_migration_folder
@@ -38,6 +75,8 @@ class Migration:
         self._migration_scripts = []
         self._module_migrations = []
         self._directory_path = False
+        # {absolute path: content}, to migrate files in memory
+        self._files = None
 
         # Get migration steps that will be runned
         found = False
@@ -52,37 +91,65 @@ class Migration:
                 break
 
         # Check consistency between format patch and module_names args
-        if format_patch and len(module_names) != 1:
+        if format_patch and not module_names:
             raise ConfigException(
-                "Format patch option can only be used for a single module"
+                "Format patch option can only be used with a list of modules"
             )
         logger.debug("Module list: %s" % module_names)
         logger.debug("format patch option : %s" % format_patch)
 
-        # convert relative or absolute directory into Path Object
-        if not os.path.exists(relative_directory_path):
-            raise ConfigException(
-                "Unable to find directory: %s" % relative_directory_path
+        if files is not None:
+            # The directory only exists in memory
+            root_path = self._directory_path = pathlib.Path(
+                os.path.abspath(relative_directory_path)
             )
+            self._files = {
+                os.path.normpath(os.path.join(str(root_path), path)): content
+                for path, content in files.items()
+            }
+        else:
+            # convert relative or absolute directory into Path Object
+            if not os.path.exists(relative_directory_path):
+                raise ConfigException(
+                    "Unable to find directory: %s" % relative_directory_path
+                )
+
+            root_path = pathlib.Path(relative_directory_path)
+            self._directory_path = pathlib.Path(root_path.resolve(strict=True))
 
-        root_path = pathlib.Path(relative_directory_path)
-        self._directory_path = pathlib.Path(root_path.resolve(strict=True))
+        if cache:
+            self._cache = MigrationCache(self._directory_path, self._migration_steps)
 
         # format-patch, if required
         if format_patch:
-            if not (root_path / module_names[0]).is_dir():
-                self._get_code_from_previous_branch(module_names[0], remote_name)
-            else:
-                logger.warning(
-                    "Ignoring format-patch argument, as the module %s"
-                    " is still present in the repository" % (module_names[0])
-                )
+            missing_module_names = []
+            for module_name in module_names:
+                if not (root_path / module_name).is_dir():
+                    missing_module_names.append(module_name)
+                else:
+                    logger.warning(
+                        "Ignoring format-patch argument, as the module %s"
+                        " is still present in the repository" % (module_name)
+                    )
+            if missing_module_names:
+                self._get_code_from_previous_branch(missing_module_names, remote_name)
 
         # Guess modules if not provided, and check validity
         if not module_names:
             module_names = []
             # Recover all submodules, if no modules list is provided
-            child_paths = [x for x in root_path.iterdir() if x.is_dir()]
+            if self._files is not None:
+                child_paths = [
+                    root_path / x
+                    for x in sorted(
+                        {
+                            os.path.relpath(path, str(root_path)).split(os.sep)[0]
+                            for path in self._files
+                        }
+                    )
+                ]
+            else:
+                child_paths = [x for x in root_path.iterdir() if x.is_dir()]
             for child_path in child_paths:
                 if self._is_module_path(child_path):
                     module_names.append(child_path.name)
@@ -93,7 +160,7 @@ class Migration:
                     module_names.remove(child_path.name)
                     logger.warning(
                         "No valid module found for '%s' in the directory '%s'"
-                        % (child_path.name, root_path.resolve())
+                        % (child_path.name, self._directory_path)
                     )
 
         if not module_names:
@@ -102,7 +169,7 @@ class Migration:
         for module_name in module_names:
             self._module_migrations.append(ModuleMigration(self, module_name))
 
-        if os.path.exists(".pre-commit-config.yaml") and self._pre_commit:
+        if self._pre_commit and os.path.exists(".pre-commit-config.yaml"):
             self._run_pre_commit(module_names)
 
         # get migration scripts, depending to the migration list
@@ -110,12 +177,19 @@ class Migration:
 
     def _run_pre_commit(self, module_names):
         logger.info("Run pre-commit")
-        _execute_shell(
-            "pre-commit run -a", path=self._directory_path, raise_error=False
-        )
+        file_paths = [
+            os.path.join(root, filename)
+            for module_name in module_names
+            for root, __, filenames in os.walk(self._directory_path / module_name)
+            for filename in filenames
+        ]
+        self._run_pre_commit_on_files(file_paths)
         if self._commit_enabled:
             logger.info("Stage and commit changes done by pre-commit")
-            _execute_shell("git add -A", path=self._directory_path)
+            _execute_shell(
+                "git add --all -- %s" % " ".join(shlex.quote(x) for x in module_names),
+                path=self._directory_path,
+            )
             _execute_shell(
                 "git commit -m '[IMP] %s: pre-commit execution' --no-verify"
                 % ", ".join(module_names),
@@ -123,88 +197,142 @@ class Migration:
                 raise_error=False,  # Don't fail if there is nothing to commit
             )
 
+    def _run_pre_commit_on_files(self, file_paths):
+        """Run pre-commit on the given files, if pre-commit is enabled and
+        if some of the files still exist. Many files are checked with a few
+        commands, each one receiving as many files as possible."""
+        if not (os.path.exists(".pre-commit-config.yaml") and self._pre_commit):
+            return
+        file_paths = [str(x) for x in file_paths if os.path.isfile(x)]
+        if not file_paths:
+            logger.debug("No file to check, pre-commit is not run")
+            return
+        start = time.perf_counter()
+        # Paths are given relative to the directory, in chunks of
+        # arguments that a single command can receive
+        relative_paths = [os.path.relpath(x, self._directory_path) for x in file_paths]
+        chunks = [[]]
+        chunk_length = 0
+        for relative_path in relative_paths:
+            if chunks[-1] and (
+                chunk_length + len(relative_path) + 1 > _MAX_FILE_ARGUMENTS_LENGTH
+            ):
+                chunks.append([])
+                chunk_length = 0
+            chunks[-1].append(relative_path)
+            chunk_length += len(relative_path) + 1
+        for chunk in chunks:
+            logger.debug("Execute pre-commit on %d files" % len(chunk))
+            try:
+                subprocess.run(
+                    ["pre-commit", "run", "--files"] + chunk,
+                    cwd=self._directory_path,
+                )
+            except OSError as e:
+                logger.error("Unable to run pre-commit: %s" % e)
+                return
+        logger.info(
+            "pre-commit run on %d files in %.2fs"
+            % (len(file_paths), time.perf_counter() - start)
+        )
+
     def _is_module_path(self, module_path):
+        if self._files is not None:
+            return any(str(module_path / x) in self._files for x in _MANIFEST_NAMES)
         return any([(module_path / x).exists() for x in _MANIFEST_NAMES])
 
-    def _get_code_from_previous_branch(self, module_name, remote_name):
+    def _get_module_files(self, module_name):
+        """Return {absolute path: content} of the files of the module, when
+        migrating files in memory, None otherwise."""
+        if self._files is None:
+            return None
+        prefix = str(self._directory_path / module_name) + os.sep
+        return {
+            path: content
+            for path, content in self._files.items()
+            if path.startswith(prefix)
+        }
+
+    def _get_code_from_previous_branch(self, module_names, remote_name):
         init_version = self._migration_steps[0]["init_version_name"]
         target_version = self._migration_steps[-1]["target_version_name"]
         branch_name = "%(version)s-mig-%(module_name)s" % {
             "version": target_version,
-            "module_name": module_name,
+            "module_name": "-".join(module_names),
         }
 
-        logger.info("Creating new branch '%s' ..." % (branch_name))
+        logger.info("Getting latest changes from old branch")
+        # Both branches are fetched at once. Objects already present locally
+        # are not downloaded again. The history is only completed if the
+        # repository is shallow.
+        is_shallow = _execute_shell(
+            "git rev-parse --is-shallow-repository", path=self._directory_path
+        )
         _execute_shell(
-            "git checkout --no-track -b %(branch)s %(remote)s/%(version)s"
+            "git fetch %(unshallow)s%(remote)s %(refspecs)s"
             % {
-                "branch": branch_name,
+                "unshallow": is_shallow.strip() == b"true" and "--unshallow " or "",
                 "remote": remote_name,
-                "version": target_version,
+                "refspecs": " ".join(
+                    "+refs/heads/%(version)s:refs/remotes/%(remote)s/%(version)s"
+                    % {"version": version, "remote": remote_name}
+                    for version in (init_version, target_version)
+                ),
             },
             path=self._directory_path,
         )
 
-        logger.info("Getting latest changes from old branch")
-        # Depth is added just in case you had a shallow git history
+        logger.info("Creating new branch '%s' ..." % (branch_name))
         _execute_shell(
-            "git fetch --depth 9999999 %(remote)s %(init)s"
+            "git checkout --no-track -b %(branch)s %(remote)s/%(version)s"
             % {
+                "branch": branch_name,
                 "remote": remote_name,
-                "init": init_version,
+                "version": target_version,
             },
             path=self._directory_path,
         )
 
+        # The commits of all the modules are applied in a single session
         _execute_shell(
             "git format-patch --keep-subject "
             "--stdout %(remote)s/%(target)s..%(remote)s/%(init)s "
-            "-- %(module)s | git am -3 --keep"
+            "-- %(modules)s | git am -3 --keep"
             % {
                 "remote": remote_name,
                 "init": init_version,
                 "target": target_version,
-                "module": module_name,
+                "modules": " ".join(shlex.quote(x) for x in module_names),
             },
             path=self._directory_path,
         )
 
-    def _load_migration_script(self, full_name):
-        module = importlib.import_module(full_name)
-        result = [
-            x[1]()
-            for x in inspect.getmembers(module, inspect.isclass)
-            if x[0] != "BaseMigrationScript" and issubclass(x[1], BaseMigrationScript)
-        ]
-        return result
-
     def _get_migration_scripts(self):
         # Add the script that will be allways executed
         self._migration_scripts.extend(
-            self._load_migration_script(
+            _load_migration_script(
                 "odoo_module_migrate.migration_scripts.migrate_allways"
             )
         )
         if self._remove_migration_folder:
             self._migration_scripts.extend(
-                self._load_migration_script(
+                _load_migration_script(
                     "odoo_module_migrate.migration_scripts."
                     "migrate_remove_migration_folder"
                 )
             )
-        all_packages = importlib.import_module("odoo_module_migrate.migration_scripts")
 
         migration_start = float(self._migration_steps[0]["init_version_code"])
         migration_end = float(self._migration_steps[-1]["target_version_code"])
 
-        for loader, name, is_pkg in pkgutil.walk_packages(all_packages.__path__):
+        for name in _MIGRATION_SCRIPTS:
             # Ignore script that will be allways executed.
             # this script will be added at the end.
             if name in ("migrate_allways", "migrate_remove_migration_folder"):
                 continue
 
             # Filter migration scripts, depending of the configuration
-            full_name = all_packages.__name__ + "." + name
+            full_name = "odoo_module_migrate.migration_scripts." + name
             if "allways" in name:
                 # replace allways by the most recent version
                 real_name = name.replace("allways", _get_latest_version_code())
@@ -219,7 +347,7 @@ class Migration:
             if script_start >= migration_end or script_end <= migration_start:
                 continue
 
-            self._migration_scripts.extend(self._load_migration_script(full_name))
+            self._migration_scripts.extend(_load_migration_script(full_name))
 
         logger.debug(
             "The following migration script will be"
@@ -238,8 +366,115 @@ class Migration:
             % (
                 self._migration_steps[0]["init_version_name"],
                 self._migration_steps[-1]["target_version_name"],
-                self._directory_path.resolve(),
+                self._directory_path,
             )
         )
+        if self._files is not None:
+            self._run_module_migrations()
+            return
+        if self._dry_run:
+            if self._dry_run == "-":
+                output = sys.stdout
+            else:
+                output = open(self._dry_run, "w")
+        try:
+            self._run_module_migrations(output=self._dry_run and output)
+        finally:
+            if self._dry_run and output is not sys.stdout:
+                output.close()
+        if self._dry_run:
+            return
+
+        # Run pre-commit once, on the files changed in all the modules,
+        # before committing each module
+        self._run_pre_commit_on_files(
+            [x for y in self._module_migrations for x in y._changed_paths]
+        )
         for module_migration in self._module_migrations:
-            module_migration.run()
+            module_migration._finalize()
+
+    def _run_module_migrations(self, output=False):
+        """Run the migration scripts on all the modules. In dry-run mode,
+        the changes of each module are written in output."""
+        if self._jobs == 1:
+            for module_migration in self._module_migrations:
+                module_migration._run_migration_scripts()
+                if self._dry_run:
+                    output.write(module_migration._diff)
+                    output.flush()
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Migrate modules in worker processes. Results are consumed in
+            # the order of the modules, so logs are the same as in a
+            # sequential run.
+            with ProcessPoolExecutor(
+                max_workers=self._jobs,
+                initializer=_init_worker,
+                initargs=(self, logger.level),
+            ) as executor:
+                results = executor.map(
+                    _run_module_migration, range(len(self._module_migrations))
+                )
+                for module_migration, (records, changed_paths, diff) in zip(
+                    self._module_migrations, results
+                ):
+                    for record in records:
+                        logger.handle(record)
+                    module_migration._changed_paths = changed_paths
+                    module_migration._diff = diff
+                    if self._dry_run:
+                        output.write(diff)
+                        output.flush()
+
+
+# {module name: [loaded migration scripts]}
+_loaded_migration_scripts = {}
+
+
+def _load_migration_script(full_name):
+    # Scripts only hold read-only rules once parsed, so they are loaded
+    # once by process and shared by all the migrations
+    result = _loaded_migration_scripts.get(full_name)
+    if result is None:
+        module = importlib.import_module(full_name)
+        result = [
+            x[1]()
+            for x in inspect.getmembers(module, inspect.isclass)
+            if x[0] != "BaseMigrationScript" and issubclass(x[1], BaseMigrationScript)
+        ]
+        for migration_script in result:
+            migration_script.parse_rules()
+        _loaded_migration_scripts[full_name] = result
+    return list(result)
+
+
+def _load_all_migration_scripts():
+    """Load and parse the rules of all the migration scripts, so that the
+    next migrations of the process do not have to."""
+    for name in _MIGRATION_SCRIPTS:
+        _load_migration_script("odoo_module_migrate.migration_scripts." + name)
+
+
+_worker_migration = False
+
+
+def _init_worker(migration, log_level):
+    global _worker_migration
+    _worker_migration = migration
+    # Logs are collected by the worker, and emitted by the main process
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(log_level)
+    logger.propagate = False
+
+
+def _run_module_migration(index):
+    collector = LogRecordCollector()
+    logger.addHandler(collector)
+    module_migration = _worker_migration._module_migrations[index]
+    try:
+        module_migration._run_migration_scripts()
+    finally:
+        logger.removeHandler(collector)
+    return collector.records, module_migration._changed_paths, module_migration._diff
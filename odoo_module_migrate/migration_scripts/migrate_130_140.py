@@ -5,8 +5,10 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 import re
 from pathlib import Path
-import lxml.etree as et
-from odoo_module_migrate.base_migration_script import BaseMigrationScript
+from odoo_module_migrate.base_migration_script import (
+    BaseMigrationScript,
+    triggers,
+)
 
 
 def src_model_new_value(field_elem, model_dot_name):
@@ -48,7 +50,44 @@ Each old attribute name is then mapped a tuple containing:
 """
 
 
-def _reformat_file(file_path: Path):
+# Tokens of an xml file: comments, CDATA sections, processing instructions,
+# doctype, and start, end or empty element tags.
+_XML_TOKEN_RE = re.compile(
+    r"<!--.*?-->"
+    r"|<!\[CDATA\[.*?\]\]>"
+    r"|<\?.*?\?>"
+    r"|<!DOCTYPE(?:[^>\[]|\[.*?\])*>"
+    r"|(?P<tag><(?P<end>/)?[^\s/>]+"
+    r"(?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*\s*(?P<empty>/)?>)",
+    re.DOTALL,
+)
+
+
+def _get_root_children_spans(xml_file):
+    """Return the (start, end) offsets in the text of an xml file of the
+    children elements of the root element, scanning the text once."""
+    spans = []
+    depth = 0
+    start = None
+    for match in _XML_TOKEN_RE.finditer(xml_file):
+        if not match.group("tag"):
+            # Comment, CDATA, processing instruction or doctype
+            continue
+        if match.group("end"):
+            depth -= 1
+            if depth == 1:
+                spans.append((start, match.end()))
+        elif match.group("empty"):
+            if depth == 1:
+                spans.append((match.start(), match.end()))
+        else:
+            if depth == 1:
+                start = match.start()
+            depth += 1
+    return spans
+
+
+def _reformat_file(logger, file_path: Path, tools):
     """Reformat `file_path`.
 
     Substitute `act_window` and `report` tag with `record` tag.
@@ -59,21 +98,31 @@ def _reformat_file(file_path: Path):
       - `name` has been renamed to `report_name`;
     - other attributes are assigned to respective fields
     """
-    parser = et.XMLParser(remove_blank_text=True)
-    tree = et.parse(str(file_path.resolve()), parser)
-    root = tree.getroot()
-    reformat_tags = (*root.findall("act_window"), *root.findall("report"))
-    if not reformat_tags:
-        return None
+    import copy
+    import lxml.etree as et
 
-    regexp = r"(?P<indent>[ \t]*)" r"(?P<tag><{tag_type}[^/]*id=\"{tag_id}\"[^/]*/>)"
+    xml_file = tools._read_content(file_path)
+    root = tools._get_xml_document(file_path).tree.getroot()
+    children = list(root.iterchildren(et.Element))
+    if not any(x.tag in TAG_ATTR_RENAMING for x in children):
+        return None
 
-    new_tags_dict = dict()
-    for tag in reformat_tags:
-        tag_regex = regexp.format(
-            tag_type=tag.tag,
-            tag_id=tag.attrib["id"],
+    # The tags are located in the text with a single scan, and the file is
+    # rebuilt once. The shared tree is left untouched.
+    spans = _get_root_children_spans(xml_file)
+    if len(spans) != len(children):
+        # The elements of the tree are not the tags of the text (entities)
+        logger.warning(
+            "Unable to locate the tags of file %s: its act_window and report"
+            " tags should be replaced by record tags manually" % file_path
         )
+        return None
+    parts = []
+    position = 0
+    for child, (start, end) in zip(children, spans):
+        if child.tag not in TAG_ATTR_RENAMING:
+            continue
+        tag = copy.deepcopy(child)
         for attrib, value in tag.attrib.items():
             if attrib == "id":
                 continue
@@ -91,36 +140,24 @@ def _reformat_file(file_path: Path):
         tag.attrib["model"] = "ir.actions." + tag.tag
         tag.tag = "record"
 
-        new_tags_dict[tag_regex] = tag
-
-    # Read in the file
-    xml_file = file_path.read_text()
-
-    # Replace the target string
-    for tag_regex, tag in new_tags_dict.items():
-        match = re.search(tag_regex, xml_file)
-        if match:
-            indent = match.group("indent")
-            tag_match = match.group("tag")
-            et.indent(tag, space=indent, level=1)
-            # Remove trailing newline
-            tag_string = et.tostring(tag, pretty_print=True)[:-1]
-            xml_file = re.sub(tag_match, tag_string.decode(), xml_file)
+        line_start = xml_file.rfind("\n", 0, start) + 1
+        indent = xml_file[line_start:start]
+        indent = indent[len(indent.rstrip(" \t")) :]
+        et.indent(tag, space=indent, level=1)
+        tag_string = et.tostring(
+            tag, encoding="unicode", pretty_print=True, with_tail=False
+        )
+        # Remove trailing newline
+        parts += [xml_file[position:start], tag_string[:-1]]
+        position = end
+    parts.append(xml_file[position:])
 
     # Write the file out again
-    file_path.write_text(xml_file)
+    tools._update_content(file_path, "".join(parts))
     return file_path
 
 
-def _get_files(module_path, reformat_file_ext):
-    """Get files to be reformatted."""
-    file_paths = list()
-    if not module_path.is_dir():
-        raise Exception(f"'{module_path}' is not a directory")
-    file_paths.extend(module_path.rglob("*" + reformat_file_ext))
-    return file_paths
-
-
+@triggers("<act_window", "<report")
 def reformat_deprecated_tags(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -131,12 +168,12 @@ def reformat_deprecated_tags(
     """
 
     reformat_file_ext = ".xml"
-    file_paths = _get_files(module_path, reformat_file_ext)
+    file_paths = tools.get_files(module_path, (reformat_file_ext,))
     logger.debug(f"{reformat_file_ext} files found:\n" f"{list(map(str, file_paths))}")
 
     reformatted_files = list()
     for file_path in file_paths:
-        reformatted_file = _reformat_file(file_path)
+        reformatted_file = _reformat_file(logger, file_path, tools)
         if reformatted_file:
             reformatted_files.append(reformatted_file)
     logger.debug("Reformatted files:\n" f"{list(reformatted_files)}")
@@ -1,8 +1,12 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo_module_migrate.base_migration_script import BaseMigrationScript
+from odoo_module_migrate.base_migration_script import (
+    BaseMigrationScript,
+    triggers,
+)
 
 
+@triggers("toggle_button")
 def replace_toggle_button(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
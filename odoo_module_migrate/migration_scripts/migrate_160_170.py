@@ -1,7 +1,10 @@
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo_module_migrate.base_migration_script import BaseMigrationScript
-import lxml.etree as et
+from odoo_module_migrate.base_migration_script import (
+    BaseMigrationScript,
+    triggers,
+)
+from odoo_module_migrate.python_source import CodeEdits, PythonSource
 from pathlib import Path
 import sys
 import os
@@ -11,26 +14,20 @@ from typing import Any
 empty_list = ast.parse("[]").body[0].value
 
 
-class AbstractVisitor(ast.NodeVisitor):
+class AbstractVisitor:
+    """Collect changes on the nodes visited by PythonSource.visit()"""
+
     def __init__(self) -> None:
         # ((line, line_end, col_offset, end_col_offset), replace_by) NO OVERLAPS
         self.change_todo = []
 
-    def post_process(self, all_code: str, file: str) -> str:
-        all_lines = all_code.split("\n")
-        for (lineno, line_end, col_offset, end_col_offset), new_substring in sorted(
-            self.change_todo, reverse=True
-        ):
-            if lineno == line_end:
-                line = all_lines[lineno - 1]
-                all_lines[lineno - 1] = (
-                    line[:col_offset] + new_substring + line[end_col_offset:]
-                )
-            else:
-                print(
-                    f"Ignore replacement {file}: {(lineno, line_end, col_offset, end_col_offset), new_substring}"
-                )
-        return "\n".join(all_lines)
+    def add_edits(self, edits: CodeEdits) -> None:
+        """Add the collected changes to the edits of the code"""
+        for position, new_text in self.change_todo:
+            edits.replace_position(position, new_text)
+
+    def post_process(self, python_source: PythonSource) -> None:
+        """Change the code, once the collected changes are applied"""
 
     def add_change(self, old_node: ast.AST, new_node: ast.AST | str):
         position = (
@@ -46,12 +43,12 @@ class AbstractVisitor(ast.NodeVisitor):
 
 
 class VisitorToPrivateReadGroup(AbstractVisitor):
-    def post_process(self, all_code: str, file: str) -> str:
-        all_lines = all_code.split("\n")
+    def post_process(self, python_source: PythonSource) -> None:
+        all_lines = python_source.code.split("\n")
         for i, line in enumerate(all_lines):
             if "super(" not in line:
                 all_lines[i] = line.replace(".read_group(", "._read_group(")
-        return "\n".join(all_lines)
+        python_source.code = "\n".join(all_lines)
 
 
 class VisitorInverseGroupbyFields(AbstractVisitor):
@@ -91,7 +88,6 @@ class VisitorInverseGroupbyFields(AbstractVisitor):
                     )
                 else:
                     raise ValueError(f"{key_i_by_key}, {keywords_by_key}, {node.args}")
-        self.generic_visit(node)
 
 
 class VisitorRenameKeywords(AbstractVisitor):
@@ -105,41 +101,62 @@ class VisitorRenameKeywords(AbstractVisitor):
                 if keyword.arg == "orderby":
                     new_keyword = ast.keyword("order", keyword.value)
                     self.add_change(keyword, new_keyword)
-        self.generic_visit(node)
 
 
 class VisitorRemoveLazy(AbstractVisitor):
-    def post_process(self, all_code: str, file: str) -> str:
-        # remove extra comma ',' and extra line if possible
-        all_code = super().post_process(all_code, file)
-        all_lines = all_code.split("\n")
-        for (lineno, __, col_offset, __), __ in sorted(self.change_todo, reverse=True):
-            comma_find = False
-            line = all_lines[lineno - 1]
-            remaining = line[col_offset:]
-            line = line[:col_offset]
-            while not comma_find:
-                if "," not in line:
-                    all_lines.pop(lineno - 1)
-                    lineno -= 1
-                    line = all_lines[lineno - 1]
-                else:
-                    comma_find = True
-            last_index_comma = -(line[::-1].index(",") + 1)
-            all_lines[lineno - 1] = line[:last_index_comma] + remaining
-
-        return "\n".join(all_lines)
+    def __init__(self) -> None:
+        super().__init__()
+        # ((line, col_offset) of the end of the previous argument, or of
+        # the function, (line, line_end, col_offset, end_col_offset) of
+        # the lazy argument)
+        self.removal_todo = []
+
+    def add_edits(self, edits: CodeEdits) -> None:
+        # remove the argument from the comma after the previous argument,
+        # with the lines left empty
+        for (previous_lineno, previous_col_offset), position in self.removal_todo:
+            lineno, end_lineno, col_offset, end_col_offset = position
+            start = edits.get_offset(lineno, col_offset)
+            comma_offset = edits.code.find(
+                ",", edits.get_offset(previous_lineno, previous_col_offset), start
+            )
+            edits.replace(
+                comma_offset if comma_offset != -1 else start,
+                edits.get_offset(end_lineno, end_col_offset),
+                "",
+            )
 
     def visit_Call(self, node: ast.Call) -> Any:
         if isinstance(node.func, ast.Attribute) and node.func.attr == "_read_group":
-            # Replace fields by aggregate and orderby by order
+            lazy_node = None
             if len(node.args) == 7:
-                self.add_change(node.args[6], "")
+                lazy_node = node.args[6]
             else:
                 for keyword in node.keywords:
                     if keyword.arg == "lazy":
-                        self.add_change(keyword, "")
-        self.generic_visit(node)
+                        lazy_node = keyword
+            if lazy_node is None:
+                return
+            lazy_start = (lazy_node.lineno, lazy_node.col_offset)
+            previous_end = max(
+                (
+                    (x.end_lineno, x.end_col_offset)
+                    for x in node.args + node.keywords
+                    if (x.end_lineno, x.end_col_offset) <= lazy_start
+                ),
+                default=(node.func.end_lineno, node.func.end_col_offset),
+            )
+            self.removal_todo.append(
+                (
+                    previous_end,
+                    (
+                        lazy_node.lineno,
+                        lazy_node.end_lineno,
+                        lazy_node.col_offset,
+                        lazy_node.end_col_offset,
+                    ),
+                )
+            )
 
 
 class VisitorAggregatesSpec(AbstractVisitor):
@@ -201,55 +218,51 @@ class VisitorAggregatesSpec(AbstractVisitor):
 
                 if aggregates is not None:
                     self.add_change(aggregate_values, repr(aggregates))
-        self.generic_visit(node)
 
 
-Steps_visitor: list[AbstractVisitor] = [
-    VisitorToPrivateReadGroup,
-    VisitorInverseGroupbyFields,
-    VisitorRenameKeywords,
-    VisitorAggregatesSpec,
-    VisitorRemoveLazy,
+# Each step works on the code changed by the previous steps. The visitors
+# of a step collect their changes in a single traversal of the syntax tree.
+Steps_visitor: list[tuple[type[AbstractVisitor], ...]] = [
+    (VisitorToPrivateReadGroup,),
+    (VisitorInverseGroupbyFields,),
+    (VisitorRenameKeywords,),
+    # The lazy argument is removed from the comma before it, after the
+    # aggregates: their changes don't overlap
+    (VisitorAggregatesSpec, VisitorRemoveLazy),
 ]
 
 
-def replace_read_group_signature(logger, filename):
-    with open(filename, mode="rt") as file:
-        new_all = all_code = file.read()
-        if ".read_group(" in all_code or "._read_group(" in all_code:
-            for Step in Steps_visitor:
-                visitor = Step()
-                try:
-                    visitor.visit(ast.parse(new_all))
-                except Exception:
-                    logger.info(
-                        f"ERROR in {filename} at step {visitor.__class__}: \n{new_all}"
-                    )
-                    raise
-                new_all = visitor.post_process(new_all, filename)
-            if new_all == all_code:
-                logger.info("read_group detected but not changed in file %s" % filename)
-
-    if new_all != all_code:
+def replace_read_group_signature(logger, filename, tools):
+    python_source = tools._get_python_source(filename)
+    all_code = python_source.code
+    if ".read_group(" in all_code or "._read_group(" in all_code:
+        for steps in Steps_visitor:
+            visitors = [Step() for Step in steps]
+            try:
+                python_source.visit(visitors)
+            except Exception:
+                logger.info(
+                    f"ERROR in {filename} at step {steps}: \n{python_source.code}"
+                )
+                raise
+            edits = python_source.get_edits()
+            for visitor in visitors:
+                visitor.add_edits(edits)
+            python_source.code = edits.apply()
+            for visitor in visitors:
+                visitor.post_process(python_source)
+        if python_source.code == all_code:
+            logger.info("read_group detected but not changed in file %s" % filename)
+
+    if python_source.code != all_code:
         logger.info("Script read_group replace applied in file %s" % filename)
-        with open(filename, mode="wt") as file:
-            file.write(new_all)
-
+        tools._update_content(filename, python_source.code)
 
-def _get_files(module_path, reformat_file_ext):
-    """Get files to be reformatted."""
-    file_paths = list()
-    if not module_path.is_dir():
-        raise Exception(f"'{module_path}' is not a directory")
-    file_paths.extend(module_path.rglob("*" + reformat_file_ext))
-    return file_paths
 
-
-def _check_open_form_view(logger, file_path: Path):
+def _check_open_form_view(logger, file_path: Path, tools):
     """Check if the view has a button to open a form reg in a tree view `file_path`."""
-    parser = et.XMLParser(remove_blank_text=True)
-    tree = et.parse(str(file_path.resolve()), parser)
-    record_node = tree.getroot()[0]
+    root_node = tools._get_xml_document(file_path).tree.getroot()
+    record_node = root_node[0]
     f_arch = record_node.find('field[@name="arch"]')
     root = f_arch if f_arch is not None else record_node
     for button in root.findall(".//button[@name='get_formview_action']"):
@@ -261,182 +274,199 @@ def _check_open_form_view(logger, file_path: Path):
         )
 
 
-def _move_attrs_to_attributes_view(logger, file_path: Path):
-    """Transform <field attrs={'required': [('field', '=', value)]}> to <field required="field == value" /> in views"""
-    parser = et.XMLParser()
-    tree = et.parse(str(file_path.resolve()), parser)
-    field_selector = "record[@model='ir.ui.view']/field[@name='arch']"
-    modified = False
+def _leaf_to_python(leaf):
+    left, operator, right = leaf.elts
+    if operator.value in ("!=", "="):
+        if (
+            isinstance(right, ast.Constant)
+            and isinstance(right.value, bool)
+            and right.value in (False, True)
+        ):
+            falsy = (
+                operator.value == "="
+                and not right.value
+                or operator.value == "!="
+                and right.value
+            )
+            return "{}{}{}".format(
+                falsy and "not" or "",
+                falsy and " " or "",
+                left.value,
+            )
+        if isinstance(right, ast.List) and not right.elts:
+            falsy = operator.value == "="
+            return "{}{}{}".format(
+                falsy and "not" or "",
+                falsy and " " or "",
+                left.value,
+            )
 
-    def leaf_to_python(leaf):
-        left, operator, right = leaf.elts
-        if operator.value in ("!=", "="):
-            if (
-                isinstance(right, ast.Constant)
-                and isinstance(right.value, bool)
-                and right.value in (False, True)
-            ):
-                falsy = (
-                    operator.value == "="
-                    and not right.value
-                    or operator.value == "!="
-                    and right.value
-                )
-                return "{}{}{}".format(
-                    falsy and "not" or "",
-                    falsy and " " or "",
-                    left.value,
-                )
-            if isinstance(right, ast.List) and not right.elts:
-                falsy = operator.value == "="
-                return "{}{}{}".format(
-                    falsy and "not" or "",
-                    falsy and " " or "",
-                    left.value,
+    return "{} {} {}".format(
+        left.value,
+        operator.value if operator.value != "=" else "==",
+        ast.unparse(right),
+    )
+
+
+def _domain_to_python(domain):
+    """Convert a domain, in Polish notation, to a python expression.
+
+    The elements are read once, from the last one to the first one: leaves
+    are pushed on a stack of operands, and operators replace the operands
+    that follow them by their expression. The operands left on the stack
+    are joined with 'and'. Operators missing their last operand, at the
+    end of the domain, get an empty one. Raise an exception if the domain
+    is malformed.
+    """
+    # [(is an operator expression, python expression)], the next operand
+    # being the last one. Elements that are neither a leaf nor an
+    # operator are kept as is, with None.
+    operands = []
+    for element in reversed(domain.elts):
+        if isinstance(element, ast.Tuple | ast.List):
+            operands.append((False, _leaf_to_python(element)))
+        elif isinstance(element, ast.Constant):
+            if element.value not in ("&", "|", "!"):
+                raise ValueError("unknown operator")
+            values = []
+            for __ in range(element.value == "!" and 1 or 2):
+                if not operands:
+                    values.append(None)
+                    continue
+                is_operator, value = operands.pop()
+                if is_operator is None:
+                    raise ValueError("malformed domain")
+                values.append(value)
+            if values[0] is None:
+                raise ValueError("missing operand")
+            if element.value == "!":
+                operands.append((True, "not ({})".format(values[0])))
+            else:
+                operands.append(
+                    (
+                        True,
+                        "("
+                        + values[0]
+                        + (" and " if element.value == "&" else " or ")
+                        + (values[1] or "")
+                        + ")",
+                    )
                 )
+        else:
+            operands.append((None, element))
+
+    result = ""
+    for position, (is_operator, value) in enumerate(operands):
+        if is_operator is None:
+            # Only accepted as the last element of the domain
+            if position:
+                raise ValueError("malformed domain")
+            value = _leaf_to_python(value)
+        if is_operator:
+            result = value + (result and f" and {result}" or "")
+        elif position:
+            result = value + " and " + result
+        else:
+            result = value
+    return result
+
+
+def _attrs_to_attributes(attrs_string):
+    try:
+        attrs_expression = ast.parse(attrs_string.strip(), mode="eval")
+    except:
+        return {}
+    if not isinstance(attrs_expression, ast.Expression):
+        return {}
+    if not isinstance(attrs_expression.body, ast.Dict):
+        return {}
+    attrs = attrs_expression.body
+    result = {}
+    for key, value in zip(attrs.keys, attrs.values):
+        try:
+            result[key.value] = _domain_to_python(value)
+        except:
+            result[key.value] = f"False # could not parse {ast.unparse(value)}"
+    return result
 
-        return "{} {} {}".format(
-            left.value,
-            operator.value if operator.value != "=" else "==",
-            ast.unparse(right),
-        )
-
-    def get_operand(domain):
-        if not domain.elts:
-            return ast.List([])
-
-        current = domain.elts[0]
-
-        if isinstance(current, ast.Tuple | ast.List):
-            return ast.List([current])
-
-        if isinstance(current, ast.Constant):
-            left = get_operand(ast.List(domain.elts[1:]))
-
-            if current.value == "!":
-                return ast.List([current] + left.elts)
-
-            right = get_operand(ast.List(domain.elts[1 + len(left.elts) :]))
-            return ast.List([current] + left.elts + right.elts)
-
-    def domain_to_python(domain):
-        if not domain.elts:
-            return ""
-        if len(domain.elts) == 1:
-            return leaf_to_python(domain.elts[0])
-        first = domain.elts[0]
-        if isinstance(first, ast.Constant):
-            if first.value in ("&", "|"):
-                left = get_operand(ast.List(domain.elts[1:]))
-                right = get_operand(ast.List(domain.elts[len(left.elts) + 1 :]))
-                tail = domain_to_python(
-                    ast.List(domain.elts[len(left.elts) + len(right.elts) + 1 :])
-                )
-                return (
-                    "("
-                    + domain_to_python(left)
-                    + (" and " if first.value == "&" else " or ")
-                    + domain_to_python(right)
-                    + ")"
-                    + (tail and f" and {tail}" or "")
-                )
-            if first.value == "!":
-                left = get_operand(ast.List(domain.elts[1:]))
-                tail = domain_to_python(ast.List(domain.elts[len(left.elts) + 1 :]))
-                return "not ({})".format(domain_to_python(left)) + (
-                    tail and f" and {tail}" or ""
-                )
 
-            raise ValueError("unknown operator")
-        if isinstance(first, ast.List | ast.Tuple):
-            return (
-                domain_to_python(ast.List([domain.elts[0]]))
-                + " and "
-                + domain_to_python(ast.List(domain.elts[1:]))
-            )
-        raise ValueError("malformed domain")
+def _move_attrs_to_attributes_view(logger, file_path: Path, tools):
+    """Transform <field attrs={'required': [('field', '=', value)]}> to <field required="field == value" /> in views"""
+    import lxml.etree as et
 
-    def attrs_to_attributes(attrs_string):
-        try:
-            attrs_expression = ast.parse(attrs_string.strip(), mode="eval")
-        except:
-            return {}
-        if not isinstance(attrs_expression, ast.Expression):
-            return {}
-        if not isinstance(attrs_expression.body, ast.Dict):
-            return {}
-        attrs = attrs_expression.body
-        result = {}
-        for key, value in zip(attrs.keys, attrs.values):
-            try:
-                result[key.value] = domain_to_python(value)
-            except:
-                result[key.value] = f"False # could not parse {ast.unparse(value)}"
-        return result
+    xml_document = tools._get_xml_document(file_path)
+    tree = xml_document.tree
+    field_selector = "record[@model='ir.ui.view']/field[@name='arch']"
+    if not tree.xpath(f"{field_selector} | data/{field_selector}"):
+        return
+    modified = False
 
-    for arch in tree.xpath(f"{field_selector} | data/{field_selector}"):
+    # All the elements of the file are converted, as soon as it contains a
+    # view. They are visited once.
+    attribute_nodes = []
+    for node in tree.iter(et.Element):
         # <field attrs="{}" />
-        for node in arch.xpath("//*[@attrs]"):
-            attributes = attrs_to_attributes(node.attrib["attrs"])
-            if not attributes:
-                continue
-            node.attrib.update(attributes)
-            del node.attrib["attrs"]
-            modified = True
+        if "attrs" in node.attrib:
+            attributes = _attrs_to_attributes(node.attrib["attrs"])
+            if attributes:
+                node.attrib.update(attributes)
+                del node.attrib["attrs"]
+                modified = True
         # inherited views
-        for node in arch.xpath("//attribute[@name='attrs']"):
-            attributes = attrs_to_attributes(node.text)
-            if not attributes:
-                continue
-            parent = node.getparent()
-            for key, value in attributes.items():
-                new_node = et.SubElement(parent, "attribute", name=key)
-                new_node.text = value
-            parent.remove(node)
-            modified = True
+        if node.tag == "attribute" and node.get("name") == "attrs":
+            attribute_nodes.append(node)
+    for node in attribute_nodes:
+        attributes = _attrs_to_attributes(node.text)
+        if not attributes:
+            continue
+        parent = node.getparent()
+        for key, value in attributes.items():
+            new_node = et.SubElement(parent, "attribute", name=key)
+            new_node.text = value
+        parent.remove(node)
+        modified = True
 
     if modified:
-        tree.write(file_path, xml_declaration=True)
-        with open(file_path, "r+") as xml_file:
-            xml_file.write('<?xml version="1.0" encoding="utf-8"?>')
-            xml_file.seek(0, 2)
-            xml_file.write("\n")
+        tools._write_xml_document(file_path, xml_document)
 
 
+@triggers("get_formview_action")
 def _check_open_form(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
     reformat_file_ext = ".xml"
-    file_paths = _get_files(module_path, reformat_file_ext)
+    file_paths = tools.get_files(module_path, (reformat_file_ext,))
     logger.debug(f"{reformat_file_ext} files found:\n" f"{list(map(str, file_paths))}")
 
     for file_path in file_paths:
-        _check_open_form_view(logger, file_path)
+        _check_open_form_view(logger, file_path, tools)
 
 
+@triggers("attrs")
 def _move_attrs_to_attributes(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
     reformat_file_ext = ".xml"
-    file_paths = _get_files(module_path, reformat_file_ext)
+    file_paths = tools.get_files(module_path, (reformat_file_ext,))
     logger.debug(f"{reformat_file_ext} files found:\n" f"{list(map(str, file_paths))}")
 
     for file_path in file_paths:
-        _move_attrs_to_attributes_view(logger, file_path)
+        _move_attrs_to_attributes_view(logger, file_path, tools)
 
 
+@triggers("read_group")
 def _reformat_read_group(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
     """Reformat read_group method in py files."""
 
     reformat_file_ext = ".py"
-    file_paths = _get_files(module_path, reformat_file_ext)
+    file_paths = tools.get_files(module_path, (reformat_file_ext,))
     logger.debug(f"{reformat_file_ext} files found:\n" f"{list(map(str, file_paths))}")
 
     reformatted_files = list()
     for file_path in file_paths:
-        reformatted_file = replace_read_group_signature(logger, file_path)
+        reformatted_file = replace_read_group_signature(logger, file_path, tools)
         if reformatted_file:
             reformatted_files.append(reformatted_file)
     logger.debug("Reformatted files:\n" f"{list(reformatted_files)}")
@@ -2,10 +2,14 @@
 # This script is based on the original code from:
 # https://github.com/odoo/odoo/blob/master/odoo/upgrade_code/17.5-00-tree-to-list.py
 
-from odoo_module_migrate.base_migration_script import BaseMigrationScript
+from odoo_module_migrate.base_migration_script import (
+    BaseMigrationScript,
+    triggers,
+)
 import re
 
 
+@triggers("tree", "Tree")
 def replace_tree_with_list_in_views(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -45,12 +49,13 @@ def replace_tree_with_list_in_views(
             content = reg_tree_to_list_String.sub(r"\1List\2", content)
             content = reg_tree_to_list_env_ref.sub(r"\1list\2", content)
 
-            tools._write_content(file, content)
+            tools._update_content(file, content)
 
         except Exception as e:
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("oe_chatter")
 def replace_chatter_blocks(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -84,6 +89,7 @@ def replace_chatter_blocks(
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("kanban-card", "kanban-box", "kanban-menu")
 def replace_deprecated_kanban_box_card_menu(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -104,6 +110,7 @@ def replace_deprecated_kanban_box_card_menu(
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("user_has_groups")
 def replace_user_has_groups(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -120,6 +127,7 @@ def replace_user_has_groups(
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("unaccent")
 def replace_unaccent_parameter(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -146,6 +154,7 @@ def replace_unaccent_parameter(
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("ustr")
 def replace_ustr(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -3,13 +3,14 @@
 import ast
 import json
 import re
-from io import BytesIO
 
-from lxml import etree
-
-from odoo_module_migrate.base_migration_script import BaseMigrationScript
+from odoo_module_migrate.base_migration_script import (
+    BaseMigrationScript,
+    triggers,
+)
 
 
+@triggers("expression", "AND(", "OR(", "import Domain")
 def migrate_expression_to_domain(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -19,7 +20,6 @@ def migrate_expression_to_domain(
     for file in files_to_process:
         try:
             content = tools._read_content(file)
-            original_content = content
 
             content = re.sub(
                 r"from odoo\.osv import expression",
@@ -59,14 +59,14 @@ def migrate_expression_to_domain(
 
             content = "\n".join(cleaned_lines)
 
-            if content != original_content:
-                tools._write_content(file, content)
+            if tools._update_content(file, content):
                 logger.info(f"Migrated expression imports to Domain in: {file}")
 
         except Exception as e:
             logger.error(f"Error processing file {file}: {str(e)}")
 
 
+@triggers("_sql_constraints")
 def upgrade_sql_constraints(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -101,9 +101,10 @@ def upgrade_sql_constraints(
         content = sql_expression_re.sub(build_sql_object, content)
         if sql_expression_re.search(content):
             logger.warning("Failed to replace sql_constraints")
-        tools._write_content(file, content)
+        tools._update_content(file, content)
 
 
+@triggers("<search")
 def _remove_group_attrs_in_search_views(
     logger, module_path, module_name, manifest_path, migration_steps, tools
 ):
@@ -112,19 +113,24 @@ def _remove_group_attrs_in_search_views(
     """
 
     files_to_process = tools.get_files(module_path, (".xml",))
+    if not files_to_process:
+        return
+    # Only imported if the module has xml files
+    from lxml import etree
 
     for file_path in files_to_process:
         try:
-            content = tools._read_content(file_path)
-            parser = etree.XMLParser(recover=True)
             try:
-                # lxml does not accept unicode strings with XML declaration,
-                # so parse from bytes to be safe.
-                tree = etree.parse(BytesIO(content.encode("utf-8")), parser)
-                root = tree.getroot()
-            except Exception:
-                # If full-parse fails, skip this file
+                xml_document = tools._get_xml_document(file_path)
+            except etree.XMLSyntaxError as e:
+                # A recovered tree may lose a part of the file: skip it
+                logger.warning(
+                    f"Unable to parse XML file {file_path}, the expand/string"
+                    f" attrs of <group> in its search views must be removed"
+                    f" manually: {e}"
+                )
                 continue
+            root = xml_document.tree.getroot()
 
             changed = False
 
@@ -137,17 +143,7 @@ def _remove_group_attrs_in_search_views(
                             changed = True
 
             if changed:
-                # Write back modified tree
-                new_content = etree.tostring(
-                    root, encoding="utf-8", xml_declaration=True
-                ).decode("utf-8")
-                new_content = new_content.replace(
-                    "<?xml version='1.0' encoding='utf-8'?>",
-                    '<?xml version="1.0" encoding="utf-8"?>',
-                )
-                if not new_content.endswith("\n"):
-                    new_content += "\n"
-                tools._write_content(file_path, new_content)
+                tools._write_xml_document(file_path, xml_document)
                 logger.info(
                     f"Removed expand/string attrs from <group> in search views: {file_path}"
                 )
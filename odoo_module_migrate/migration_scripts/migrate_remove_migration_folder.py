@@ -3,17 +3,17 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import os
-import subprocess
 from odoo_module_migrate.base_migration_script import BaseMigrationScript
 
 
 def remove_migration_folder(**kwargs):
     logger = kwargs["logger"]
     module_path = kwargs["module_path"]
+    tools = kwargs["tools"]
     migration_path_folder = os.path.join(module_path, "migrations")
-    if os.path.exists(migration_path_folder):
+    if tools._path_exists(migration_path_folder):
         logger.info("Removing 'migrations' folder")
-        subprocess.check_output("rm -r %s" % migration_path_folder, shell=True)
+        tools._remove_path(migration_path_folder)
 
 
 class MigrationScript(BaseMigrationScript):
@@ -2,11 +2,16 @@
 # @author: Sylvain LE GAL (https://twitter.com/legalsylvain)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import functools
+import inspect
 import os
+import pathlib
 
 from .log import logger
 
-from .config import _MANIFEST_NAMES
+from . import tools
+from .config import _ALLOWED_EXTENSIONS, _MANIFEST_NAMES
+from .file_buffer import FileBuffer
 from .tools import _execute_shell
 
 
@@ -15,13 +20,19 @@ class ModuleMigration:
     _migration = False
     _module_name = False
     _module_path = False
+    # Paths changed on disk by the migration scripts
+    _changed_paths = ()
+    # Changes of the module, in dry-run mode, in the format of 'git diff'
+    _diff = ""
+    # In-memory copy of the files, once migrated
+    _file_buffer = None
 
     def __init__(self, migration, module_name):
         self._migration = migration
         self._module_name = module_name
         self._module_path = self._migration._directory_path / module_name
 
-    def run(self):
+    def _run_migration_scripts(self):
         logger.info(
             "[%s] Running migration from %s to %s"
             % (
@@ -31,25 +42,133 @@ class ModuleMigration:
             )
         )
 
-        # Apply migration script
+        # When modules are migrated in parallel, the git index is only
+        # touched by the main process, when committing the changes.
+        git_enabled = self._migration._commit_enabled and self._migration._jobs == 1
+
+        # Apply migration script on an in-memory copy of the module files,
+        # written on disk at the end.
+        file_buffer = FileBuffer(
+            self._module_path, self._migration._get_module_files(self._module_name)
+        )
+        with tools._use_file_buffer(file_buffer):
+            if self._migration._fused:
+                self._run_fused_migration_scripts(git_enabled)
+            else:
+                for migration_script in self._migration._migration_scripts:
+                    migration_script.run(
+                        self._module_path,
+                        self._get_manifest_path(),
+                        self._module_name,
+                        self._migration._migration_steps,
+                        self._migration._directory_path,
+                        git_enabled,
+                        self._migration._cache,
+                    )
+        if file_buffer.in_memory:
+            # Files are only migrated in memory, and kept in the buffer
+            self._file_buffer = file_buffer
+        elif self._migration._dry_run:
+            self._diff = file_buffer.diff(self._migration._directory_path)
+        else:
+            self._changed_paths = file_buffer.flush(git_enabled)
+        if self._migration._cache:
+            self._migration._cache._log_stats()
+
+    def _run_fused_migration_scripts(self, git_enabled):
+        """Run the migration scripts, grouping the consecutive scripts that
+        don't have global functions. The files are processed by all the
+        scripts of a group, one file after another, then the global
+        functions of the last script of the group are called.
+
+        Text replaces only depend on the content of the processed file,
+        and deprecated modules only on the manifest, so each file goes
+        through the same changes as when the scripts are run one after
+        another. Global functions, that can work on any file, see the
+        module in the same state."""
+        migration_scripts = []
         for migration_script in self._migration._migration_scripts:
-            migration_script.run(
+            migration_scripts.append(migration_script)
+            if migration_script._GLOBAL_FUNCTIONS:
+                self._run_fused_scripts(migration_scripts, git_enabled)
+                migration_scripts = []
+        if migration_scripts:
+            self._run_fused_scripts(migration_scripts, git_enabled)
+
+    def _run_fused_scripts(self, migration_scripts, git_enabled):
+        logger.debug(
+            "Running fused scripts %s"
+            % ", ".join(
+                inspect.getfile(x.__class__).split("/")[-1] for x in migration_scripts
+            )
+        )
+        for migration_script in migration_scripts:
+            if not migration_script._rules_parsed:
+                migration_script.parse_rules()
+
+        manifest_path = self._get_manifest_path()
+        # The files are listed with their resolved path, the manifest path
+        # is the one in the module path, that can be a symbolic link
+        real_manifest_path = manifest_path and os.path.realpath(manifest_path)
+        with tools._count_written_content() as written_content:
+            for file_path in tools.get_files(self._module_path, _ALLOWED_EXTENSIONS):
+                if os.path.realpath(file_path) == real_manifest_path:
+                    manifest_path = pathlib.Path(
+                        self._process_fused_file(
+                            migration_scripts, file_path, True, git_enabled
+                        )
+                    )
+                elif self._migration._cache:
+                    self._migration._cache.process_file(
+                        migration_scripts,
+                        file_path,
+                        functools.partial(
+                            self._process_fused_file,
+                            migration_scripts,
+                            file_path,
+                            False,
+                            git_enabled,
+                        ),
+                    )
+                else:
+                    self._process_fused_file(
+                        migration_scripts, file_path, False, git_enabled
+                    )
+
+            migration_scripts[-1]._run_global_functions(
                 self._module_path,
-                self._get_manifest_path(),
                 self._module_name,
+                manifest_path,
                 self._migration._migration_steps,
-                self._migration._directory_path,
-                self._migration._commit_enabled,
             )
+        logger.debug(
+            "Fused scripts changed %d files (%d bytes)"
+            % (len(written_content["files"]), written_content["bytes"])
+        )
 
-        # Run pre-commit before final commit to format any changes made during migration scripts execution
-        if os.path.exists(".pre-commit-config.yaml") and self._migration._pre_commit:
-            _execute_shell(
-                "pre-commit run -a",
-                path=self._migration._directory_path,
-                raise_error=False,
+    def _process_fused_file(
+        self, migration_scripts, file_path, is_manifest, git_enabled
+    ):
+        """Process a file with all the migration scripts, and return its
+        new path. The deprecated modules are handled in the manifest."""
+        file_path = str(file_path)
+        for migration_script in migration_scripts:
+            root, filename = os.path.split(file_path)
+            file_path = migration_script.process_file(
+                root,
+                filename,
+                os.path.splitext(filename)[1],
+                migration_script._FILE_RENAMES,
+                self._migration._directory_path,
+                git_enabled,
             )
+            if is_manifest:
+                migration_script.handle_deprecated_modules(
+                    file_path, migration_script._DEPRECATED_MODULES
+                )
+        return file_path
 
+    def _finalize(self):
         self._commit_changes(
             "[MIG] %s: Migration to %s"
             % (
@@ -61,42 +180,36 @@ class ModuleMigration:
     def _get_manifest_path(self):
         for manifest_name in _MANIFEST_NAMES:
             manifest_path = self._module_path / manifest_name
-            if manifest_path.exists():
+            if tools._path_exists(manifest_path):
                 return manifest_path
 
-    def _rename_file(self, module_path, old_file_path, new_file_path):
-        """
-        Rename a file. try to execute 'git mv', to avoid huge diff.
-
-        if 'git mv' fails, make a classical rename
-        """
-        logger.info(
-            "Renaming file: '%s' by '%s' "
-            % (
-                old_file_path.replace(str(module_path.resolve()), ""),
-                new_file_path.replace(str(module_path.resolve()), ""),
-            )
-        )
-        if self._migration._commit_enabled:
-            _execute_shell(
-                "git mv %s %s" % (old_file_path, new_file_path), path=module_path
-            )
-        else:
-            _execute_shell(
-                "mv %s %s" % (old_file_path, new_file_path), path=module_path
-            )
-
     def _commit_changes(self, commit_name):
         if not self._migration._commit_enabled:
             return
 
-        if _execute_shell("git diff", path=self._migration._directory_path):
-            logger.info(
-                "Commit changes for %s. commit name '%s'"
-                % (self._module_name, commit_name)
-            )
+        # pre-commit only runs on the files changed by the migration
+        # scripts. Without them, there is nothing to commit, and git is not
+        # called.
+        if not self._changed_paths:
+            logger.debug("No changes to commit for %s" % self._module_name)
+            return
 
-            _execute_shell(
-                " git add . --all && git commit --no-verify -m '%s'" % (commit_name),
-                path=self._migration._directory_path,
-            )
+        _execute_shell(
+            "git add --all -- '%s'" % self._module_name,
+            path=self._migration._directory_path,
+        )
+        if not _execute_shell(
+            "git diff --cached --quiet -- '%s'" % self._module_name,
+            path=self._migration._directory_path,
+            raise_error=False,
+        ).returncode:
+            logger.debug("No changes to commit for %s" % self._module_name)
+            return
+
+        logger.info(
+            "Commit changes for %s. commit name '%s'" % (self._module_name, commit_name)
+        )
+        _execute_shell(
+            "git commit --no-verify -m '%s'" % commit_name,
+            path=self._migration._directory_path,
+        )
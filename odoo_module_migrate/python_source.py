@@ -0,0 +1,151 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import ast
+
+from .log import logger
+
+
+def _iter_nodes(tree):
+    """Yield the nodes of a tree in the order of ast.NodeVisitor: a node,
+    then the nodes of its children."""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+
+class PythonSource:
+    """Source code of a python file, and its syntax tree.
+
+    The tree is parsed the first time it is requested, and parsed again
+    only if the code has been changed since. Several visitors can collect
+    changes in a single traversal of the tree, and all their changes are
+    applied in one pass on the code.
+    """
+
+    def __init__(self, code, file_path=""):
+        self._code = code
+        self._file_path = file_path
+        self._tree = None
+        self.parse_count = 0
+
+    @property
+    def code(self):
+        return self._code
+
+    @code.setter
+    def code(self, code):
+        if code != self._code:
+            self._code = code
+            self._tree = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = ast.parse(self._code)
+            self.parse_count += 1
+        return self._tree
+
+    def visit(self, visitors):
+        """Traverse the tree once, calling the ``visit_<node class name>``
+        methods of the visitors on each node. The children of a node are
+        always visited, so these methods must not call generic_visit()."""
+        if not any(
+            name.startswith("visit_") for visitor in visitors for name in dir(visitor)
+        ):
+            return
+        handlers_by_class = {}
+        for node in _iter_nodes(self.tree):
+            handlers = handlers_by_class.get(node.__class__)
+            if handlers is None:
+                method_name = "visit_" + node.__class__.__name__
+                handlers = handlers_by_class[node.__class__] = [
+                    getattr(visitor, method_name)
+                    for visitor in visitors
+                    if hasattr(visitor, method_name)
+                ]
+            for handler in handlers:
+                handler(node)
+
+    def get_edits(self):
+        """Return an empty CodeEdits of the current code"""
+        return CodeEdits(self._code, self._file_path)
+
+    def apply_changes(self, changes):
+        """Replace parts of the code.
+
+        :param changes: iterable of
+            ((lineno, end_lineno, col_offset, end_col_offset), new_text),
+            positions being the ones of the nodes of the current tree.
+        Changes overlapping another one are ignored.
+        """
+        edits = self.get_edits()
+        for position, new_text in changes:
+            edits.replace_position(position, new_text)
+        self.code = edits.apply()
+
+
+class CodeEdits:
+    """Replacements of parts of a code, applied at once.
+
+    Positions of the nodes of the syntax tree (line numbers, and column
+    offsets in UTF-8 bytes) are converted to offsets in the code with a
+    table of the offsets of the lines, built once. Replacements can span
+    several lines, and the code is rebuilt in a single pass.
+    """
+
+    def __init__(self, code, file_path=""):
+        self.code = code
+        self._file_path = file_path
+        self._lines = code.split("\n")
+        self._line_offsets = []
+        offset = 0
+        for line in self._lines:
+            self._line_offsets.append(offset)
+            offset += len(line) + 1
+        # [(start, end, new_text)]
+        self._edits = []
+
+    def get_offset(self, lineno, col_offset):
+        """Return the offset in the code of a position of the tree"""
+        line = self._lines[lineno - 1]
+        if not line.isascii():
+            col_offset = len(line.encode("utf-8")[:col_offset].decode("utf-8"))
+        return self._line_offsets[lineno - 1] + col_offset
+
+    def replace(self, start, end, new_text):
+        """Replace code[start:end] by new_text"""
+        self._edits.append((start, end, new_text))
+
+    def replace_position(self, position, new_text):
+        """Replace the code at a position of the tree:
+        (lineno, end_lineno, col_offset, end_col_offset)"""
+        lineno, end_lineno, col_offset, end_col_offset = position
+        self.replace(
+            self.get_offset(lineno, col_offset),
+            self.get_offset(end_lineno, end_col_offset),
+            new_text,
+        )
+
+    def apply(self):
+        """Return the code, once replaced. Replacements overlapping the
+        next one are ignored."""
+        edits = []
+        next_start = len(self.code)
+        for start, end, new_text in sorted(self._edits, reverse=True):
+            if end > next_start:
+                logger.warning(
+                    "Ignore overlapping replacement %s: %s"
+                    % (self._file_path, (start, end, new_text))
+                )
+                continue
+            edits.append((start, end, new_text))
+            next_start = start
+        parts = []
+        position = 0
+        for start, end, new_text in reversed(edits):
+            parts += [self.code[position:start], new_text]
+            position = end
+        parts.append(self.code[position:])
+        return "".join(parts)
@@ -0,0 +1,246 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Prebuilt index of the rules defined in the yaml files of the migration
+scripts.
+
+The yaml files of each migration step are validated and loaded by
+``build_index()``, and stored in a pickle file shipped with the package.
+At run time, the rules of a step are read from the index, unless one of
+its yaml files has been added, removed or changed since the index was
+built: the files of the step are then read again.
+
+Build the index after changing the yaml files with:
+
+    python -m odoo_module_migrate.rule_index
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+
+from .exception import ConfigException
+from .log import logger
+
+_MIGRATION_SCRIPTS_PATH = os.path.join(os.path.dirname(__file__), "migration_scripts")
+_INDEX_NAME = "rules.index"
+
+# Increase it when the format of the index changes
+_INDEX_VERSION = 2
+
+TYPE_ARRAY = "TYPE_ARRAY"
+TYPE_DICT = "TYPE_DICT"
+TYPE_DICT_OF_DICT = "TYPE_DICT_OF_DICT"
+
+# {rule attribute: type of the rule}. The yaml files of a rule are in the
+# folder named after the attribute (ex: text_replaces/migrate_FROM_TO/).
+_RULE_TYPES = {
+    "_TEXT_REPLACES": TYPE_DICT_OF_DICT,
+    "_TEXT_ERRORS": TYPE_DICT_OF_DICT,
+    "_TEXT_WARNINGS": TYPE_DICT_OF_DICT,
+    "_DEPRECATED_MODULES": TYPE_ARRAY,
+    "_FILE_RENAMES": TYPE_DICT,
+    "_REMOVED_FIELDS": TYPE_ARRAY,
+    "_RENAMED_FIELDS": TYPE_ARRAY,
+    "_RENAMED_MODELS": TYPE_ARRAY,
+    "_REMOVED_MODELS": TYPE_ARRAY,
+}
+
+# {rule attribute: (minimum number of items, maximum number of items,
+# number of string items)} of the items of the array rules. The items
+# after the string ones are additional information, that can be null.
+_ARRAY_ITEM_LENGTHS = {
+    "_DEPRECATED_MODULES": (2, 4, 2),
+    "_REMOVED_FIELDS": (3, 3, 2),
+    "_RENAMED_FIELDS": (4, 4, 3),
+    "_RENAMED_MODELS": (3, 3, 2),
+    "_REMOVED_MODELS": (2, 2, 1),
+}
+
+# {action: number of required items} of the deprecated modules
+_DEPRECATED_MODULE_ACTIONS = {
+    "removed": 2,
+    "renamed": 3,
+    "merged": 3,
+    "oca_moved": 4,
+}
+
+# {path of the migration scripts: index loaded from this path}
+_indexes = {}
+
+
+def _get_rule_folder(rule):
+    return rule[1:].lower()
+
+
+def _validate_rules(rule, rules):
+    """Check rules read from a yaml file have the expected structure.
+    Return a description of the first error found, or None."""
+    rule_type = _RULE_TYPES[rule]
+    if rule_type == TYPE_DICT_OF_DICT:
+        if not isinstance(rules, dict):
+            return "expected a mapping {file type: {pattern: value}}"
+        for file_type, values in rules.items():
+            if not isinstance(file_type, str) or not isinstance(values, dict):
+                return "expected a mapping of patterns for %r" % (file_type,)
+            for pattern, value in values.items():
+                if not isinstance(pattern, str):
+                    return "pattern %r is not a string" % (pattern,)
+                if value is not None and not isinstance(value, str):
+                    return "value of %r is not a string" % (pattern,)
+    elif rule_type == TYPE_DICT:
+        if not isinstance(rules, dict):
+            return "expected a mapping {old name: new name}"
+        for key, value in rules.items():
+            if not isinstance(key, str) or not isinstance(value, str):
+                return "%r: %r is not a mapping of strings" % (key, value)
+    else:
+        if not isinstance(rules, list):
+            return "expected a list"
+        min_length, max_length, string_length = _ARRAY_ITEM_LENGTHS[rule]
+        for item in rules:
+            if not isinstance(item, list) or not (
+                min_length <= len(item) <= max_length
+            ):
+                if min_length == max_length:
+                    return "%r should be a list of %d items" % (item, min_length)
+                return "%r should be a list of %d to %d items" % (
+                    item,
+                    min_length,
+                    max_length,
+                )
+            if not all(isinstance(x, str) for x in item[:string_length]) or not all(
+                x is None or isinstance(x, str) for x in item[string_length:]
+            ):
+                return "%r should only contain strings" % (item,)
+            if rule == "_DEPRECATED_MODULES":
+                required_length = _DEPRECATED_MODULE_ACTIONS.get(item[1])
+                if required_length is None:
+                    return "unknown action %r" % item[1]
+                if len(item) < required_length:
+                    return "%r should have at least %d items" % (
+                        item,
+                        required_length,
+                    )
+    return None
+
+
+def _get_yaml_file_names(directory_path):
+    return sorted(x for x in os.listdir(directory_path) if x.endswith(".yaml"))
+
+
+def _read_step_rules(scripts_path, step, validate=False):
+    """Read the yaml files of a migration step. Return a tuple
+    ({rule: [rules of each file]}, {rule folder: {name: (size, hash)}}).
+    Modification times are not stored: they change when the package is
+    installed or cloned."""
+    import yaml
+
+    step_rules = {}
+    folders = {}
+    for rule in _RULE_TYPES:
+        folder = _get_rule_folder(rule)
+        directory_path = os.path.join(scripts_path, folder, step)
+        if not os.path.isdir(directory_path):
+            continue
+        files = {}
+        for name in _get_yaml_file_names(directory_path):
+            path = os.path.join(directory_path, name)
+            with open(path, "rb") as f:
+                content = f.read()
+            files[name] = (len(content), hashlib.sha256(content).hexdigest())
+            rules = yaml.safe_load(content)
+            if validate:
+                error = _validate_rules(rule, rules)
+                if error:
+                    raise ConfigException(
+                        "Invalid rules in %s: %s"
+                        % (os.path.relpath(path, scripts_path), error)
+                    )
+            step_rules.setdefault(rule, []).append(rules)
+        folders[folder] = files
+    return step_rules, folders
+
+
+def _is_up_to_date(scripts_path, step, folders):
+    """Return True if the yaml files of the step are the ones described in
+    the index. Files are hashed only if their size did not change."""
+    for rule in _RULE_TYPES:
+        folder = _get_rule_folder(rule)
+        directory_path = os.path.join(scripts_path, folder, step)
+        files = folders.get(folder)
+        if not os.path.isdir(directory_path):
+            if files is not None:
+                return False
+            continue
+        if files is None or _get_yaml_file_names(directory_path) != sorted(files):
+            return False
+        for name, (size, digest) in files.items():
+            path = os.path.join(directory_path, name)
+            if os.path.getsize(path) != size:
+                return False
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != digest:
+                    return False
+    return True
+
+
+def _get_steps(scripts_path):
+    steps = set()
+    for rule in _RULE_TYPES:
+        folder_path = os.path.join(scripts_path, _get_rule_folder(rule))
+        if os.path.isdir(folder_path):
+            steps.update(
+                x
+                for x in os.listdir(folder_path)
+                if os.path.isdir(os.path.join(folder_path, x))
+            )
+    return sorted(steps)
+
+
+def build_index(scripts_path=_MIGRATION_SCRIPTS_PATH):
+    """Validate the yaml files of all the migration steps, and write the
+    index of their rules. Return the path of the index."""
+    index = {"version": _INDEX_VERSION, "steps": {}}
+    for step in _get_steps(scripts_path):
+        step_rules, folders = _read_step_rules(scripts_path, step, validate=True)
+        index["steps"][step] = {"rules": step_rules, "folders": folders}
+    index_path = os.path.join(scripts_path, _INDEX_NAME)
+    with open(index_path, "wb") as f:
+        pickle.dump(index, f, protocol=4)
+    return index_path
+
+
+def _get_index(scripts_path):
+    """Return the index of the migration scripts, loaded once by process.
+    If it can not be loaded, the rules are read from the yaml files."""
+    index = _indexes.get(scripts_path)
+    if index is None:
+        try:
+            with open(os.path.join(scripts_path, _INDEX_NAME), "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.debug("Unable to load the rule index: %s" % e)
+            index = {}
+        if index.get("version") != _INDEX_VERSION:
+            index = {"version": _INDEX_VERSION, "steps": {}}
+        _indexes[scripts_path] = index
+    return index
+
+
+def get_step_rules(scripts_path, step):
+    """Return the rules defined in the yaml files of a migration step:
+    {rule attribute: [rules of each file, in the order of the file names]}.
+    """
+    entry = _get_index(scripts_path)["steps"].get(step) or {
+        "rules": {},
+        "folders": {},
+    }
+    if _is_up_to_date(scripts_path, step, entry["folders"]):
+        return entry["rules"]
+    logger.debug("Rule index outdated for %s, reading yaml files" % step)
+    return _read_step_rules(scripts_path, step)[0]
+
+
+if __name__ == "__main__":
+    path = build_index(*sys.argv[1:])
+    print("Rule index written in %s" % path)
@@ -0,0 +1,119 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from .__main__ import main
+from .log import logger
+from .migration import _load_all_migration_scripts
+
+
+def _warm_up():
+    """Load the migration scripts and parse their rules. Workers forked
+    from the server inherit them, other workers load them once."""
+    _load_all_migration_scripts()
+
+
+def _run_job(args, cwd):
+    """Run a command line (as given to odoo-module-migrate) in the current
+    directory cwd. Return its exit code, and what it wrote on the standard
+    output and on the standard error, logs included."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    handlers = list(logger.handlers)
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(cwd)
+                exit_code = main(list(args)) or 0
+            except SystemExit as e:
+                # Invalid arguments
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        # Each job sets up its own log handler
+        for handler in list(logger.handlers):
+            if handler not in handlers:
+                logger.removeHandler(handler)
+                handler.close()
+    return {
+        "exit_code": exit_code,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+    }
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # One job by line, until the client closes the connection
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = self.server._executor.submit(
+                    _run_job, request["args"], request.get("cwd") or os.getcwd()
+                ).result()
+            except Exception:
+                response = {
+                    "exit_code": 1,
+                    "stdout": "",
+                    "stderr": traceback.format_exc(),
+                }
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class MigrationServer(socketserver.ThreadingUnixStreamServer):
+    """Server running migrate and check jobs sent on a Unix socket.
+
+    The migration scripts are loaded and their rules parsed when the
+    server starts, and jobs are queued on a pool of worker processes that
+    keep them, so that a job only spends time on the files of the modules.
+
+    A job is a JSON line {"args": [command line arguments], "cwd": path},
+    the arguments being the ones of odoo-module-migrate ('check' first for
+    a check job). The response is a JSON line {"exit_code": int,
+    "stdout": str, "stderr": str}.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers=1):
+        _warm_up()
+        self._socket_path = socket_path
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+        # Remove the socket left by a server that was not stopped properly
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+        super().__init__(socket_path, _JobHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # A job can change any directory the server can write in: only the
+        # user running the server can connect. The socket does not accept
+        # connections before listen(), called after.
+        os.chmod(self._socket_path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown()
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+
+
+def send_job(socket_path, args, cwd=None):
+    """Send a job to the server listening on socket_path, and return its
+    response."""
+    request = {"args": list(args), "cwd": cwd or os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with client.makefile("rb") as f:
+            return json.loads(f.readline())
@@ -2,6 +2,9 @@
 # @author: Sylvain LE GAL (https://twitter.com/legalsylvain)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import contextlib
+import os
+import shutil
 import subprocess
 import re
 import pathlib
@@ -9,6 +12,26 @@ import pathlib
 from .config import _AVAILABLE_MIGRATION_STEPS
 from .log import logger
 
+# {(pattern, flags): compiled pattern}
+# Unlike the cache of the re module, it is not limited in size: rules are
+# compiled once, and reused for all the files of all the modules.
+_compiled_patterns = {}
+# Hits and misses of the cache, and patterns given already compiled (the
+# rules compiled when they are parsed)
+_compiled_patterns_stats = {"hits": 0, "misses": 0, "precompiled": 0}
+
+# FileBuffer of the module being migrated. See _use_file_buffer()
+_file_buffer = None
+
+# Files and bytes written by _write_content. See _count_written_content()
+_written_content_stats = None
+# {path: XmlDocument} written by _write_xml_document, counted when leaving
+# _count_written_content()
+_written_xml_documents = None
+
+# Function selecting the files returned by get_files(). See _filter_files()
+_files_filter = None
+
 
 def _get_available_init_version_names():
     return [x["init_version_name"] for x in _AVAILABLE_MIGRATION_STEPS]
@@ -36,7 +59,40 @@ def _execute_shell(shell_command, path=False, raise_error=True):
         return subprocess.run(shell_command, shell=True)
 
 
+def _git_update_index(path, file_paths):
+    """Stage the given files, added, changed or removed, with a single
+    git command, run in path."""
+    logger.debug("Stage %d files in %s" % (len(file_paths), path))
+    subprocess.run(
+        ["git", "update-index", "--add", "--remove", "-z", "--stdin"],
+        input="\0".join(os.path.relpath(x, path) for x in file_paths).encode(),
+        cwd=path,
+        check=True,
+    )
+
+
+@contextlib.contextmanager
+def _use_file_buffer(file_buffer):
+    """Redirect the file operations done by the functions of this module
+    on the files of a module to its FileBuffer."""
+    global _file_buffer
+    previous_file_buffer, _file_buffer = _file_buffer, file_buffer
+    try:
+        yield file_buffer
+    finally:
+        _file_buffer = previous_file_buffer
+
+
+def _get_file_buffer(file_path):
+    if _file_buffer is not None and _file_buffer.handles(file_path):
+        return _file_buffer
+    return None
+
+
 def _read_content(file_path):
+    file_buffer = _get_file_buffer(file_path)
+    if file_buffer and (file_buffer.in_memory or file_buffer.exists(file_path)):
+        return file_buffer.read(file_path)
     f = open(file_path, "r")
     text = f.read()
     f.close()
@@ -44,24 +100,195 @@ def _read_content(file_path):
 
 
 def _write_content(file_path, content):
+    if _written_content_stats is not None:
+        _written_content_stats["files"].add(str(file_path))
+        _written_content_stats["bytes"] += len(content.encode("utf-8"))
+    file_buffer = _get_file_buffer(file_path)
+    if file_buffer:
+        file_buffer.write(file_path, content)
+        return
     f = open(file_path, "w")
     f.write(content)
     f.close()
 
 
+def _update_content(file_path, content):
+    """Write content in the file, only if it is different from the current
+    content of the file. Return True if the file has been written."""
+    if _path_exists(file_path) and _read_content(file_path) == content:
+        return False
+    _write_content(file_path, content)
+    return True
+
+
+@contextlib.contextmanager
+def _count_written_content():
+    """Count the files and the bytes written by _write_content in the block.
+    Yield a dictionary {"files": set of paths, "bytes": int}."""
+    global _written_content_stats, _written_xml_documents
+    previous_stats = _written_content_stats, _written_xml_documents
+    _written_content_stats = {"files": set(), "bytes": 0}
+    _written_xml_documents = {}
+    try:
+        yield _written_content_stats
+        # The trees are serialized once, when the content is requested:
+        # the size of the xml files is only known now
+        for xml_document in _written_xml_documents.values():
+            _written_content_stats["bytes"] += len(
+                xml_document.serialize().encode("utf-8")
+            )
+    finally:
+        _written_content_stats, _written_xml_documents = previous_stats
+
+
+def _path_exists(path):
+    file_buffer = _get_file_buffer(path)
+    if file_buffer:
+        return file_buffer.exists(path)
+    return os.path.exists(path)
+
+
+def _rename_path(old_path, new_path):
+    file_buffer = _get_file_buffer(old_path)
+    if file_buffer:
+        file_buffer.rename(old_path, new_path)
+        return
+    os.rename(old_path, new_path)
+
+
+def _remove_path(path):
+    """Remove a file or a folder"""
+    file_buffer = _get_file_buffer(path)
+    if file_buffer:
+        file_buffer.remove(path)
+        return
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _get_python_source(file_path):
+    """Return the PythonSource of a python file. While a module is
+    migrated, it is shared by all the functions working on the syntax
+    tree of the file, as long as the file is not changed otherwise."""
+    from .python_source import PythonSource
+
+    content = _read_content(file_path)
+    file_buffer = _get_file_buffer(file_path)
+    python_source = file_buffer and file_buffer.get_parsed(file_path, "python")
+    if not python_source or python_source.code != content:
+        python_source = PythonSource(content, str(file_path))
+        if file_buffer:
+            file_buffer.set_parsed(file_path, "python", python_source)
+    return python_source
+
+
+def _get_xml_document(file_path):
+    """Return the XmlDocument of an xml file. While a module is migrated,
+    it is shared by all the functions working on the tree of the file, as
+    long as the file is not changed otherwise. Raise
+    lxml.etree.XMLSyntaxError if the file can not be parsed."""
+    from .xml_document import XmlDocument
+
+    file_buffer = _get_file_buffer(file_path)
+    xml_document = file_buffer and file_buffer.get_parsed(file_path, "xml")
+    # A changed tree is ahead of the content of the file
+    if xml_document and xml_document.changed:
+        return xml_document
+    content = _read_content(file_path)
+    if not xml_document or not xml_document.matches(content):
+        xml_document = XmlDocument(content, str(file_path))
+        if file_buffer:
+            file_buffer.set_parsed(file_path, "xml", xml_document)
+    return xml_document
+
+
+def _write_xml_document(file_path, xml_document):
+    """Write an xml file from the tree of its XmlDocument, changed by the
+    caller. While a module is migrated, the tree is serialized once, when
+    the content of the file is requested."""
+    xml_document.changed = True
+    file_buffer = _get_file_buffer(file_path)
+    if not file_buffer:
+        _write_content(file_path, xml_document.serialize())
+        return
+    if _written_content_stats is not None:
+        _written_content_stats["files"].add(str(file_path))
+        _written_xml_documents[str(file_path)] = xml_document
+    file_buffer.write_parsed(file_path, "xml", xml_document)
+
+
+def _get_file_literals(file_path, scanner):
+    """Return the literals of the LiteralScanner found in a file. While a
+    module is migrated, the file is scanned again only if it changed."""
+    content = _read_content(file_path)
+    file_buffer = _get_file_buffer(file_path)
+    scanned = file_buffer and file_buffer.get_parsed(file_path, "literals")
+    if (
+        not scanned
+        or scanned[0] is not scanner
+        or (scanned[1] is not content and scanned[1] != content)
+    ):
+        scanned = (scanner, content, scanner.scan(content))
+        if file_buffer:
+            file_buffer.set_parsed(file_path, "literals", scanned)
+    return scanned[2]
+
+
+@contextlib.contextmanager
+def _filter_files(files_filter):
+    """Only return from get_files() in the block the files for which
+    files_filter(file_path) is True."""
+    global _files_filter
+    previous_files_filter, _files_filter = _files_filter, files_filter
+    try:
+        yield
+    finally:
+        _files_filter = previous_files_filter
+
+
+def _compile_pattern(pattern, flags=0):
+    """Return the compiled version of a regular expression, compiling it
+    only the first time it is requested."""
+    if isinstance(pattern, re.Pattern):
+        _compiled_patterns_stats["precompiled"] += 1
+        return pattern
+    key = (pattern, flags)
+    compiled = _compiled_patterns.get(key)
+    if compiled is None:
+        _compiled_patterns_stats["misses"] += 1
+        compiled = _compiled_patterns[key] = re.compile(pattern, flags)
+    else:
+        _compiled_patterns_stats["hits"] += 1
+    return compiled
+
+
+def _log_compiled_patterns_stats(previous_stats):
+    """Log the use of the compiled patterns since previous_stats, a copy
+    of _compiled_patterns_stats"""
+    logger.debug(
+        "Compiled patterns cache: %d hits, %d misses, %d precompiled patterns"
+        % tuple(
+            _compiled_patterns_stats[x] - previous_stats[x]
+            for x in ("hits", "misses", "precompiled")
+        )
+    )
+
+
 def _replace_in_file(file_path, replaces, log_message=False):
     current_text = _read_content(file_path)
     new_text = current_text
 
     for old_term, new_term in replaces.items():
-        new_text = re.sub(old_term, new_term or "", new_text)
+        new_text = _compile_pattern(old_term).sub(new_term or "", new_text)
 
     # Write file if changed
     if new_text != current_text:
         if not log_message:
             log_message = "Changing content of file: %s" % file_path.name
         logger.info(log_message)
-        _write_content(file_path, new_text)
+        _update_content(file_path, new_text)
     return new_text
 
 
@@ -69,13 +296,19 @@ def get_files(module_path, extensions):
     """
     Returns a list of files with the specified extensions within the module_path.
     """
-    file_paths = []
-    module_dir = pathlib.Path(module_path)
+    file_buffer = _get_file_buffer(module_path)
+    if file_buffer:
+        file_paths = file_buffer.get_files(extensions)
+    else:
+        file_paths = []
+        module_dir = pathlib.Path(module_path)
 
-    if not module_dir.is_dir():
-        raise Exception(f"'{module_path}' is not a valid directory.")
+        if not module_dir.is_dir():
+            raise Exception(f"'{module_path}' is not a valid directory.")
 
-    for ext in extensions:
-        file_paths.extend(module_dir.rglob(f"*{ext}"))
+        for ext in extensions:
+            file_paths.extend(module_dir.rglob(f"*{ext}"))
 
+    if _files_filter:
+        file_paths = [x for x in file_paths if _files_filter(x)]
     return file_paths
@@ -0,0 +1,44 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from lxml import etree
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>'
+
+
+class XmlDocument:
+    """Content of an xml file, and its lxml tree.
+
+    The content is parsed once, keeping its blank text and comments, and
+    the tree is shared by the functions working on the file. Once the tree
+    has been changed, the content is serialized from it only when it is
+    requested. See tools._get_xml_document().
+    """
+
+    def __init__(self, content, file_path=""):
+        self._content = content
+        self._file_path = file_path
+        self.tree = etree.ElementTree(
+            etree.fromstring(content.encode("utf-8"), etree.XMLParser())
+        )
+        # True if the tree has been changed since the content was set
+        self.changed = False
+
+    def matches(self, content):
+        """Return True if the tree is the one of the given content"""
+        return not self.changed and (
+            self._content is content or self._content == content
+        )
+
+    def serialize(self):
+        """Return the content of the file, serializing the tree if it has
+        been changed."""
+        if self.changed:
+            content = etree.tostring(
+                self.tree, encoding="utf-8", xml_declaration=True
+            ).decode("utf-8")
+            content = XML_DECLARATION + content[content.index("?>") + 2 :]
+            if not content.endswith("\n"):
+                content += "\n"
+            self._content = content
+            self.changed = False
+        return self._content
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Copyright <YEAR(S)> <AUTHOR(S)>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+{
+    "name": "Module name",
+    "version": "8.0.3.0.0",
+    "installable": False,
+    'license': 'AGPL-3',
+    'depends': [
+        'sale',
+        'account_anglo_saxon',
+        'account_analytic_analysis',
+        'account_chart',
+        'account_check_writing',
+        'web_kanban_sparkline',
+        'web',
+        "base_suspend_security",
+    ],
+}
@@ -0,0 +1 @@
+# Some script
@@ -0,0 +1 @@
+from . import models
\ No newline at end of file
@@ -0,0 +1,8 @@
+# Copyright <YEAR(S)> <AUTHOR(S)>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+{
+    "name": "Module name",
+    "version": "12.0.1.0.0",
+    "installable": False,
+    "license": "AGPL-3",
+}
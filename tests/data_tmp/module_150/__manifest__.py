@@ -0,0 +1,13 @@
+# Copyright 2022 Camptocamp SA (https://www.camptocamp.com).
+# @author Iván Todorovich <ivan.todorovich@camptocamp.com>
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+{
+    "name": "Module name",
+    "version": "15.0.1.0.0",
+    "installable": False,
+    'license': 'AGPL-3',
+    'depends': [
+        'base',
+    ],
+}
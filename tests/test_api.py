@@ -0,0 +1,78 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import contextlib
+import os
+import pathlib
+import unittest
+import unittest.mock
+
+from odoo_module_migrate.api import migrate_files
+from odoo_module_migrate.migration import _load_all_migration_scripts
+
+
+def _read_files(directory_path, prefix):
+    files = {}
+    for root, __, filenames in os.walk(str(directory_path)):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path) as f:
+                files[
+                    os.path.join(prefix, os.path.relpath(path, str(directory_path)))
+                ] = f.read()
+    return files
+
+
+class TestMigrateFiles(unittest.TestCase):
+
+    _template_path = pathlib.Path("./tests/data_template").resolve()
+    _expected_path = pathlib.Path("./tests/data_result").resolve()
+
+    def _migrate_files(
+        self, module_name, result_name, init_version_name, target_version_name
+    ):
+        files = _read_files(self._template_path / module_name, module_name)
+        files["README.md"] = "Not a module file"
+        # Rules are read from disk when the migration scripts are loaded
+        _load_all_migration_scripts()
+        with contextlib.ExitStack() as stack:
+            for name in ("builtins.open", "os.walk", "os.path.exists", "os.stat"):
+                stack.enter_context(
+                    unittest.mock.patch(name, side_effect=AssertionError(name))
+                )
+            result = migrate_files(files, init_version_name, target_version_name)
+        expected_files = _read_files(self._expected_path / result_name, module_name)
+        expected_files["README.md"] = "Not a module file"
+        self.assertEqual(sorted(result.files), sorted(expected_files))
+        for path, content in expected_files.items():
+            self.assertEqual(result.files[path], content, path)
+        return result
+
+    def test_migrate_files_080_130(self):
+        result = self._migrate_files("module_080", "module_080_130", "8.0", "13.0")
+        self.assertEqual(
+            result.renames,
+            {
+                os.path.join("module_080", "__openerp__.py"): os.path.join(
+                    "module_080", "__manifest__.py"
+                )
+            },
+        )
+        self.assertIn(
+            {
+                "module": "module_080",
+                "level": "error",
+                "message": "Depends on removed module 'account_anglo_saxon'",
+            },
+            result.diagnostics,
+        )
+        self.assertTrue(
+            any(
+                x["message"].endswith(
+                    os.path.join("module_080", "models", "sale_order.py")
+                )
+                for x in result.diagnostics
+            )
+        )
+
+    def test_migrate_files_160_170(self):
+        self._migrate_files("module_160", "module_160_170", "16.0", "17.0")
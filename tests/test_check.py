@@ -0,0 +1,120 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+from filecmp import dircmp
+
+from odoo_module_migrate.__main__ import main
+from odoo_module_migrate.check import Check
+
+
+class TestCheck(unittest.TestCase):
+
+    _template_path = pathlib.Path("./tests/data_template").resolve()
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self._tmp_path = pathlib.Path(tmp_dir.name)
+        self._working_path = self._tmp_path / "modules"
+        shutil.copytree(
+            self._template_path / "module_080", self._working_path / "module_080"
+        )
+
+    def _check(self, *args):
+        output_path = str(self._tmp_path / "report.json")
+        exit_code = main(
+            [
+                "check",
+                "--directory",
+                str(self._working_path),
+                "--init-version-name",
+                "8.0",
+                "--target-version-name",
+                "13.0",
+                "--output",
+                output_path,
+                *args,
+            ]
+        )
+        with open(output_path) as f:
+            return exit_code, json.load(f)
+
+    def test_check_json(self):
+        exit_code, findings = self._check("--format", "json", "--jobs", "1")
+        self.assertEqual(exit_code, 1)
+        self.assertIn(
+            {
+                "file": os.path.join("module_080", "models", "sale_order.py"),
+                "line": 18,
+                "column": 1,
+                "level": "error",
+            },
+            [
+                {k: x[k] for k in ("file", "line", "column", "level")}
+                for x in findings
+                if "@api.cr" in x["message"]
+            ],
+        )
+        self.assertTrue(
+            any(
+                x["file"].endswith("demo_ir_values.xml")
+                and x["line"] == 4
+                and x["rule_id"].startswith("migrate_100_110/text_errors/")
+                for x in findings
+            )
+        )
+        # Nothing is written in the modules
+        comparison = dircmp(
+            str(self._template_path / "module_080"),
+            str(self._working_path / "module_080"),
+        )
+        self.assertFalse(
+            comparison.diff_files or comparison.left_only or comparison.right_only
+        )
+
+    def test_check_parallel(self):
+        findings = Check(str(self._working_path), "8.0", "13.0", jobs=1).run()
+        for i in range(40):
+            shutil.copytree(
+                self._working_path / "module_080" / "models",
+                self._working_path / "module_080" / ("models_%d" % i),
+            )
+        parallel_findings = Check(str(self._working_path), "8.0", "13.0", jobs=2).run()
+        self.assertEqual(
+            [
+                x
+                for x in parallel_findings
+                if not x["file"].startswith("module_080/models_")
+            ],
+            findings,
+        )
+        self.assertEqual(
+            len(
+                [
+                    x
+                    for x in parallel_findings
+                    if x["file"].startswith("module_080/models_3/")
+                ]
+            ),
+            len([x for x in findings if x["file"].startswith("module_080/models/")]),
+        )
+
+    def test_check_sarif(self):
+        exit_code, sarif = self._check("--format", "sarif")
+        self.assertEqual(sarif["version"], "2.1.0")
+        run = sarif["runs"][0]
+        rule_ids = [x["id"] for x in run["tool"]["driver"]["rules"]]
+        self.assertEqual(len(rule_ids), len(set(rule_ids)))
+        self.assertTrue(run["results"])
+        for result in run["results"]:
+            self.assertEqual(rule_ids[result["ruleIndex"]], result["ruleId"])
+            location = result["locations"][0]["physicalLocation"]
+            self.assertTrue(
+                location["artifactLocation"]["uri"].startswith("module_080/")
+            )
+            self.assertGreater(location["region"]["startLine"], 0)
@@ -0,0 +1,66 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+import unittest
+
+from odoo_module_migrate.matcher import LiteralScanner, PatternMatcher
+
+
+class TestPatternMatcher(unittest.TestCase):
+
+    _text = """
+        partner = self.env["res.partner"].search([("customer", "=", True)])
+        order.partner_shipping_id = partner
+        # TODO: @api.multi
+        """
+
+    _rules = [
+        (r"""(['"]customer['"]|\.customer[\s,=])""", "removed field"),
+        (r"res\.partner\b", "model"),
+        (r"res\.partner\.bank", "unknown model"),
+        (r"partner_", "prefix"),
+        (r"partner_shipping_id", "longest literal at the same position"),
+        (r"(?i)@API\.MULTI", "ignore case"),
+        (r"[A-Z]{4}", "no literal"),
+        (re.compile(r"order \. partner", re.VERBOSE), "verbose"),
+        (r"(self|cr)\.env", "branch"),
+        (r"(foo|bar)\[", "branch without match"),
+    ]
+
+    def test_search(self):
+        matcher = PatternMatcher(self._rules)
+        expected = [
+            value
+            for pattern, value in self._rules
+            if re.compile(pattern).search(self._text)
+        ]
+        self.assertEqual([x[0] for x in matcher.search(self._text)], expected)
+        self.assertEqual(
+            expected,
+            [
+                "removed field",
+                "model",
+                "prefix",
+                "longest literal at the same position",
+                "ignore case",
+                "no literal",
+                "verbose",
+                "branch",
+            ],
+        )
+
+    def test_match(self):
+        matcher = PatternMatcher([(r"customer", "field")])
+        [(value, match)] = matcher.search(self._text)
+        self.assertEqual(match.start(), self._text.index("customer"))
+        self.assertEqual(PatternMatcher([]).search(self._text), [])
+
+
+class TestLiteralScanner(unittest.TestCase):
+    def test_scan(self):
+        scanner = LiteralScanner(["partner", "partner_shipping_id", "customer", "foo"])
+        self.assertEqual(
+            scanner.scan(TestPatternMatcher._text),
+            {"partner", "partner_shipping_id", "customer"},
+        )
+        self.assertEqual(LiteralScanner([]).scan(TestPatternMatcher._text), set())
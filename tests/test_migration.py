@@ -2,19 +2,41 @@
 # @author: Sylvain LE GAL (https://twitter.com/legalsylvain)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import importlib
+import inspect
 import os
+import pkgutil
 import re
 from filecmp import dircmp
 import pathlib
 import shutil
+import subprocess
+import tempfile
 import unittest
+import unittest.mock
 
 from odoo_module_migrate.__main__ import main
+from odoo_module_migrate import tools
+from odoo_module_migrate.base_migration_script import BaseMigrationScript, triggers
+from odoo_module_migrate.file_buffer import FileBuffer
+from odoo_module_migrate.log import logger
+from odoo_module_migrate.config import _MIGRATION_SCRIPTS
+from odoo_module_migrate.exception import ConfigException
+from odoo_module_migrate.migration import Migration
+from odoo_module_migrate.python_source import PythonSource
+from odoo_module_migrate.migration_scripts import (
+    migrate_130_140,
+    migrate_160_170,
+    migrate_180_190,
+)
 from odoo_module_migrate.tools import _read_content
 
 
 class TestMigration(unittest.TestCase):
 
+    _jobs = 1
+    _fused = False
+    _cache = False
     _template_path = pathlib.Path("./tests/data_template").resolve()
     _working_path = pathlib.Path("./tests/data_tmp").resolve()
     _expected_path = pathlib.Path("./tests/data_result").resolve()
@@ -24,22 +46,29 @@ class TestMigration(unittest.TestCase):
     ):
         shutil.rmtree(self._working_path, ignore_errors=True)
         shutil.copytree(self._template_path, self._working_path)
+        main(self._get_main_args(module_name, init_version_name, target_version_name))
 
-        main(
-            [
-                "--directory",
-                str(self._working_path),
-                "--init-version-name",
-                init_version_name,
-                "--target-version-name",
-                target_version_name,
-                "--modules",
-                module_name,
-                "--log-path",
-                str(self._working_path / "test_log.log"),
-                "--no-commit",
-            ]
-        )
+    def _get_main_args(self, module_name, init_version_name, target_version_name):
+        args = [
+            "--directory",
+            str(self._working_path),
+            "--init-version-name",
+            init_version_name,
+            "--target-version-name",
+            target_version_name,
+            "--modules",
+            module_name,
+            "--log-path",
+            str(self._working_path / "test_log.log"),
+            "--no-commit",
+            "--jobs",
+            str(self._jobs),
+        ]
+        if self._fused:
+            args.append("--fused")
+        if self._cache:
+            args.append("--cache")
+        return args
 
     def _get_comparison(self, module_name, result_name):
         comparison = dircmp(
@@ -180,3 +209,488 @@ class TestMigration(unittest.TestCase):
             "Differences found in the following files\n- %s"
             % ("\n- ".join(diff_files)),
         )
+
+
+class TestMigrationParallel(TestMigration):
+
+    _jobs = 2
+
+
+class TestMigrationFused(TestMigration):
+
+    _fused = True
+
+    def test_symlinked_module(self):
+        # The manifest of a module linked in the directory is migrated as
+        # when the scripts are run one after another
+        with tempfile.TemporaryDirectory() as tmp_path:
+            for name, fused in (("sequential", False), ("fused", True)):
+                shutil.copytree(
+                    self._template_path / "module_080",
+                    os.path.join(tmp_path, name, "module_080"),
+                )
+                os.makedirs(os.path.join(tmp_path, name + "_link"))
+                os.symlink(
+                    os.path.join(tmp_path, name, "module_080"),
+                    os.path.join(tmp_path, name + "_link", "module_080"),
+                )
+                Migration(
+                    os.path.join(tmp_path, name + "_link"),
+                    "8.0",
+                    "12.0",
+                    ["module_080"],
+                    commit_enabled=False,
+                    pre_commit=False,
+                    fused=fused,
+                ).run()
+            comparison = dircmp(
+                os.path.join(tmp_path, "sequential", "module_080"),
+                os.path.join(tmp_path, "fused", "module_080"),
+            )
+            self.assertFalse(self._get_diff_files(comparison, "./"))
+
+
+class TestMigrationCache(TestMigration):
+
+    _cache = True
+
+    def _get_log_messages(self):
+        log = _read_content(self._working_path / "test_log.log")
+        # Remove date and time, and durations
+        log = re.sub(r"^\S+ \S+ ", "", log, flags=re.MULTILINE)
+        return re.sub(r" in \d+\.\d+s$", "", log, flags=re.MULTILINE)
+
+    def _migrate_module(
+        self, module_name, result_name, init_version_name, target_version_name
+    ):
+        # Migrate the module a second time, reusing the changes stored in
+        # the cache by the first migration
+        super()._migrate_module(
+            module_name, result_name, init_version_name, target_version_name
+        )
+        log_messages = self._get_log_messages()
+        cache_path = self._working_path / ".odoo_module_migrate_cache"
+        self.assertTrue(any(cache_path.rglob("*.json")))
+        with tempfile.TemporaryDirectory() as tmp_path:
+            shutil.move(str(cache_path), tmp_path)
+            shutil.rmtree(self._working_path)
+            shutil.copytree(self._template_path, self._working_path)
+            shutil.move(
+                os.path.join(tmp_path, ".odoo_module_migrate_cache"), str(cache_path)
+            )
+        main(self._get_main_args(module_name, init_version_name, target_version_name))
+        self.assertEqual(self._get_log_messages(), log_messages)
+
+
+class TestMigrationDryRun(TestMigration):
+    def _migrate_module(
+        self, module_name, result_name, init_version_name, target_version_name
+    ):
+        # Write the changes in a patch, check the module is unchanged, then
+        # apply the patch to compare the result with the expected one
+        shutil.rmtree(self._working_path, ignore_errors=True)
+        shutil.copytree(self._template_path, self._working_path)
+        with tempfile.TemporaryDirectory() as tmp_path:
+            patch_path = os.path.join(tmp_path, "migration.patch")
+            main(
+                self._get_main_args(module_name, init_version_name, target_version_name)
+                + ["--dry-run", patch_path]
+            )
+            comparison = dircmp(
+                str(self._template_path / module_name),
+                str(self._working_path / module_name),
+            )
+            self.assertFalse(self._get_diff_files(comparison, "./"))
+            self.assertFalse(comparison.left_only or comparison.right_only)
+            self.assertNotEqual(_read_content(patch_path), "")
+            # Apply the patch outside of the repository of the tests
+            subprocess.run(
+                ["git", "apply", patch_path],
+                cwd=str(self._working_path),
+                env=dict(
+                    os.environ, GIT_CEILING_DIRECTORIES=str(self._working_path.parent)
+                ),
+                check=True,
+            )
+
+    def test_dry_run_with_cache(self):
+        with self.assertRaisesRegex(ConfigException, "dry-run"):
+            Migration(
+                str(self._template_path),
+                "15.0",
+                "16.0",
+                ["module_150"],
+                cache=True,
+                dry_run="-",
+            )
+        self.assertFalse((self._template_path / ".odoo_module_migrate_cache").exists())
+
+
+class TestMigrationScriptRules(unittest.TestCase):
+    def test_migration_scripts_index(self):
+        # All the migration scripts of the package are in the index
+        package = importlib.import_module("odoo_module_migrate.migration_scripts")
+        self.assertEqual(
+            _MIGRATION_SCRIPTS,
+            [name for __, name, __ in pkgutil.walk_packages(package.__path__)],
+        )
+
+    def test_rules_parsed_once(self):
+        migration = Migration(
+            "./tests/data_template",
+            "15.0",
+            "17.0",
+            ["module_150"],
+            commit_enabled=False,
+            pre_commit=False,
+        )
+        scripts = {
+            inspect.getfile(x.__class__).split("/")[-1]: x
+            for x in migration._migration_scripts
+        }
+        script = scripts["migrate_150_160.py"]
+        renamed_models = script._RENAMED_MODELS
+        self.assertTrue(renamed_models)
+        # Rules are not merged into the shared class attributes
+        self.assertEqual(BaseMigrationScript._RENAMED_MODELS, [])
+        self.assertEqual(scripts["migrate_160_170.py"]._RENAMED_MODELS, ())
+
+        with self.assertRaises(TypeError):
+            script._TEXT_REPLACES[".py"]["foo"] = "bar"
+
+        script.parse_rules()
+        self.assertEqual(script._RENAMED_MODELS, renamed_models)
+
+    def test_global_function_triggers(self):
+        calls = []
+
+        def get_function(name, extensions):
+            def function(module_path, tools, **kwargs):
+                file_paths = tools.get_files(module_path, extensions)
+                calls.append((name, sorted(x.name for x in file_paths)))
+                for file_path in file_paths:
+                    tools._update_content(file_path, name + "\n")
+
+            return function
+
+        class MigrationScript(BaseMigrationScript):
+            _GLOBAL_FUNCTIONS = [
+                triggers("foo")(get_function("foo", (".py",))),
+                triggers("bar", "baz")(get_function("bar", (".py", ".xml"))),
+                triggers("missing")(get_function("missing", (".py",))),
+                get_function("write_bar", (".xml",)),
+                # Sees the files changed by the previous functions
+                triggers("bar")(get_function("bar_again", (".py", ".xml"))),
+            ]
+
+        module_path = os.path.abspath("module")
+        file_buffer = FileBuffer(
+            module_path,
+            {
+                os.path.join(module_path, "a.py"): "foo = 1\n",
+                os.path.join(module_path, "b.py"): "bar = foo\n",
+                os.path.join(module_path, "c.xml"): "<baz/>\n",
+                os.path.join(module_path, "d.xml"): "<data/>\n",
+            },
+        )
+        script = MigrationScript()
+        script.parse_rules()
+        with tools._use_file_buffer(file_buffer):
+            script._run_global_functions(module_path, "module", None, [])
+        self.assertEqual(
+            calls,
+            [
+                ("foo", ["a.py", "b.py"]),
+                ("bar", ["c.xml"]),
+                ("write_bar", ["c.xml", "d.xml"]),
+                ("bar_again", ["c.xml", "d.xml"]),
+            ],
+        )
+
+
+class TestAttrsToAttributes(unittest.TestCase):
+    def test_domain_to_python(self):
+        for domain, expected in [
+            (
+                "['|', ('a', '=', 1), '&', '!', ('b', '!=', False), ('c', '=', [])]",
+                "(a == 1 or (not (b) and not c))",
+            ),
+            (
+                "[('a', '=', 1), '|', ('b', '=', 2), ('c', 'in', [1, 2]), "
+                "('d', '=', True)]",
+                "a == 1 and (b == 2 or c in [1, 2]) and d",
+            ),
+            ("[]", ""),
+            # Malformed domains
+            ("['&', ('a', '=', 1)]", "(a == 1 and )"),
+            ("['!']", "False # could not parse ['!']"),
+            ("[('a', '=', 1), foo]", "False # could not parse [('a', '=', 1), foo]"),
+            (
+                "['x', ('a', '=', 1), ('b', '=', 1)]",
+                "False # could not parse ['x', ('a', '=', 1), ('b', '=', 1)]",
+            ),
+        ]:
+            self.assertEqual(
+                migrate_160_170._attrs_to_attributes("{'invisible': %s}" % domain),
+                {"invisible": expected},
+            )
+
+
+class TestRemoveLazy(unittest.TestCase):
+    def test_remove_lazy(self):
+        python_source = PythonSource(
+            "a = [1, 2]\n"
+            "groups = self._read_group(lazy=False)\n"
+            "groups = self._read_group(\n"
+            "    [],  # domain, with a comma\n"
+            "    ['name'],\n"
+            "    lazy=False,\n"
+            ")\n"
+            "groups = self._read_group([], [], [], 0, None, '', True)\n"
+        )
+        visitor = migrate_160_170.VisitorRemoveLazy()
+        python_source.visit([visitor])
+        edits = python_source.get_edits()
+        visitor.add_edits(edits)
+        self.assertEqual(
+            edits.apply(),
+            "a = [1, 2]\n"
+            "groups = self._read_group()\n"
+            "groups = self._read_group(\n"
+            "    [],  # domain, with a comma\n"
+            "    ['name'],\n"
+            ")\n"
+            "groups = self._read_group([], [], [], 0, None, '')\n",
+        )
+
+
+class TestReformatDeprecatedTags(unittest.TestCase):
+    def test_reformat_file(self):
+        module_path = os.path.abspath("module")
+        file_path = os.path.join(module_path, "views.xml")
+        file_buffer = FileBuffer(
+            module_path,
+            {
+                file_path: """<?xml version="1.0" encoding="utf-8"?>
+<odoo>
+    <!-- <report id="commented"/> -->
+    <report id="report_a" name="module.report_a" string="Rapport é"
+        attachment="(object.name or '').replace('/', '') + '.pdf'"/>
+    <data>
+        <report id="nested" name="Nested"/>
+    </data>
+  <act_window id="action_b" name="B &amp; C" res_model="b.model"></act_window>
+</odoo>
+"""
+            },
+        )
+        with tools._use_file_buffer(file_buffer):
+            migrate_130_140._reformat_file(logger, file_path, tools)
+            self.assertEqual(
+                tools._read_content(file_path),
+                """<?xml version="1.0" encoding="utf-8"?>
+<odoo>
+    <!-- <report id="commented"/> -->
+    <record id="report_a" model="ir.actions.report">
+        <field name="report_name">module.report_a</field>
+        <field name="name">Rapport é</field>
+        <field name="attachment">(object.name or '').replace('/', '') + '.pdf'</field>
+    </record>
+    <data>
+        <report id="nested" name="Nested"/>
+    </data>
+  <record id="action_b" model="ir.actions.act_window">
+    <field name="name">B &amp; C</field>
+    <field name="res_model">b.model</field>
+  </record>
+</odoo>
+""",
+            )
+
+    def test_reformat_file_unlocated_tags(self):
+        module_path = os.path.abspath("module")
+        file_path = os.path.join(module_path, "views.xml")
+        content = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE odoo [<!ENTITY menu "<menuitem id='menu'/>">]>
+<odoo>
+    &menu;
+    <report id="report_a" name="module.report_a" string="Report"/>
+</odoo>
+"""
+        file_buffer = FileBuffer(module_path, {file_path: content})
+        with tools._use_file_buffer(file_buffer):
+            with self.assertLogs(logger, "WARNING") as logs:
+                migrate_130_140._reformat_file(logger, file_path, tools)
+            self.assertIn(file_path, logs.output[0])
+            self.assertEqual(tools._read_content(file_path), content)
+
+
+class TestRemoveGroupAttrsInSearchViews(unittest.TestCase):
+    def test_malformed_file(self):
+        module_path = os.path.abspath("module")
+        file_path = os.path.join(module_path, "views.xml")
+        content = '<odoo>\n    <search><group expand="0"></search>\n</odoo>\n'
+        file_buffer = FileBuffer(module_path, {file_path: content})
+        with tools._use_file_buffer(file_buffer):
+            with self.assertLogs(logger, "WARNING") as logs:
+                migrate_180_190._remove_group_attrs_in_search_views(
+                    logger, module_path, "module", None, [], tools
+                )
+            self.assertIn(file_path, logs.output[0])
+            self.assertEqual(tools._read_content(file_path), content)
+
+
+GIT_ENVIRON = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@test",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@test",
+}
+
+
+class TestMigrationCommit(unittest.TestCase):
+    def _git(self, path, *args):
+        return subprocess.check_output(
+            ["git", *args], cwd=path, env=dict(os.environ, **GIT_ENVIRON), text=True
+        )
+
+    def test_format_patch(self):
+        with tempfile.TemporaryDirectory() as tmp_path, unittest.mock.patch.dict(
+            os.environ, GIT_ENVIRON
+        ):
+            remote_path = os.path.join(tmp_path, "remote.git")
+            work_path = os.path.join(tmp_path, "work")
+            clone_path = os.path.join(tmp_path, "clone")
+            self._git(tmp_path, "init", "-q", "--bare", remote_path)
+            self._git(tmp_path, "init", "-q", "-b", "15.0", work_path)
+            self._git(work_path, "commit", "-q", "--allow-empty", "-m", "init")
+            self._git(work_path, "push", "-q", remote_path, "15.0", "15.0:16.0")
+            for name in ("module_a", "other", "module_b"):
+                os.mkdir(os.path.join(work_path, name))
+                with open(os.path.join(work_path, name, "__manifest__.py"), "w") as f:
+                    f.write("{'name': '%s', 'version': '15.0.1.0.0'}\n" % name)
+                self._git(work_path, "add", name)
+                self._git(work_path, "commit", "-q", "-m", "[ADD] %s" % name)
+            self._git(work_path, "push", "-q", remote_path, "15.0")
+            self._git(
+                tmp_path,
+                "clone",
+                "-q",
+                "--depth=1",
+                "-b",
+                "16.0",
+                "file://" + remote_path,
+                clone_path,
+            )
+
+            Migration(
+                clone_path,
+                "15.0",
+                "16.0",
+                ["module_a", "module_b"],
+                format_patch=True,
+                pre_commit=False,
+            )
+            self.assertEqual(
+                self._git(clone_path, "rev-parse", "--abbrev-ref", "HEAD").strip(),
+                "16.0-mig-module_a-module_b",
+            )
+            self.assertEqual(
+                self._git(clone_path, "log", "--format=%s", "origin/16.0..HEAD"),
+                "[ADD] module_b\n[ADD] module_a\n",
+            )
+            self.assertFalse(os.path.exists(os.path.join(clone_path, "other")))
+
+    def test_commit_changes(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            shutil.copytree(
+                TestMigration._template_path / "module_150",
+                os.path.join(tmp_path, "module_150"),
+            )
+            self._git(tmp_path, "init", "-q")
+            self._git(tmp_path, "add", "-A")
+            self._git(tmp_path, "commit", "-q", "-m", "init")
+            with unittest.mock.patch.dict(os.environ, GIT_ENVIRON):
+                Migration(
+                    tmp_path, "15.0", "16.0", ["module_150"], pre_commit=False
+                ).run()
+            self.assertEqual(
+                self._git(tmp_path, "log", "-1", "--format=%s").strip(),
+                "[MIG] module_150: Migration to 16.0",
+            )
+            self.assertEqual(self._git(tmp_path, "status", "--porcelain"), "")
+
+    def test_pre_commit_on_changed_files(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            for module_name in ("module_150", "module_160"):
+                shutil.copytree(
+                    TestMigration._template_path / module_name,
+                    os.path.join(tmp_path, module_name),
+                )
+            with unittest.mock.patch(
+                "odoo_module_migrate.migration.subprocess.run"
+            ) as run, unittest.mock.patch(
+                "os.path.exists",
+                side_effect=lambda x, exists=os.path.exists: (
+                    x == ".pre-commit-config.yaml" or exists(x)
+                ),
+            ):
+                migration = Migration(
+                    tmp_path,
+                    "15.0",
+                    "16.0",
+                    ["module_150", "module_160"],
+                    commit_enabled=False,
+                )
+                self.assertEqual(run.call_count, 1)
+                migration.run()
+            # pre-commit runs once for all the modules
+            self.assertEqual(run.call_count, 2)
+            command = run.call_args[0][0]
+            self.assertEqual(command[:3], ["pre-commit", "run", "--files"])
+            self.assertEqual(run.call_args[1]["cwd"], pathlib.Path(tmp_path))
+            self.assertIn(os.path.join("module_150", "__manifest__.py"), command)
+            self.assertIn(os.path.join("module_160", "__manifest__.py"), command)
+            self.assertNotIn(
+                os.path.join("module_150", "models", "__init__.py"), command
+            )
+
+    def test_pre_commit_on_many_files(self):
+        with tempfile.TemporaryDirectory() as tmp_path:
+            shutil.copytree(
+                TestMigration._template_path / "module_150",
+                os.path.join(tmp_path, "module_150"),
+            )
+            data_path = os.path.join(tmp_path, "module_150", "data")
+            os.makedirs(data_path, exist_ok=True)
+            for i in range(4000):
+                with open(
+                    os.path.join(data_path, "data_with_a_long_name_%04d.xml" % i), "w"
+                ) as f:
+                    f.write("<odoo/>\n")
+            with unittest.mock.patch(
+                "odoo_module_migrate.migration.subprocess.run"
+            ) as run, unittest.mock.patch(
+                "os.path.exists",
+                side_effect=lambda x, exists=os.path.exists: (
+                    x == ".pre-commit-config.yaml" or exists(x)
+                ),
+            ):
+                Migration(
+                    tmp_path, "15.0", "16.0", ["module_150"], commit_enabled=False
+                )
+            # The files are checked with several commands, that do not
+            # exceed the length of the arguments of a command
+            self.assertGreater(run.call_count, 1)
+            file_paths = []
+            for call in run.call_args_list:
+                command = call[0][0]
+                self.assertEqual(command[:3], ["pre-commit", "run", "--files"])
+                self.assertLess(sum(len(x) + 1 for x in command), 128 * 1024)
+                file_paths += command[3:]
+            self.assertEqual(len(file_paths), len(set(file_paths)))
+            self.assertIn(
+                os.path.join("module_150", "data", "data_with_a_long_name_3999.xml"),
+                file_paths,
+            )
+            self.assertFalse(any(os.path.isabs(x) for x in file_paths))
@@ -0,0 +1,81 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import ast
+import unittest
+
+from odoo_module_migrate.python_source import PythonSource
+
+
+class CallCollector:
+    def __init__(self, name, new_name):
+        self.name = name
+        self.new_name = new_name
+        self.changes = []
+
+    def visit_Attribute(self, node):
+        if node.attr == self.name:
+            # Replace the attribute name, after the value and the dot
+            self.changes.append(
+                (
+                    (
+                        node.end_lineno,
+                        node.end_lineno,
+                        node.end_col_offset - len(node.attr),
+                        node.end_col_offset,
+                    ),
+                    self.new_name,
+                )
+            )
+
+
+class TestPythonSource(unittest.TestCase):
+    def test_visit_and_apply_changes(self):
+        python_source = PythonSource("a.foo(b.bar(1))\nc.bar()\n")
+        visitors = [CallCollector("foo", "new_foo"), CallCollector("bar", "baz")]
+        python_source.visit(visitors)
+        self.assertEqual(python_source.parse_count, 1)
+        self.assertEqual(len(visitors[0].changes), 1)
+        self.assertEqual(len(visitors[1].changes), 2)
+
+        # The tree is parsed again only if the code changed
+        python_source.apply_changes([])
+        self.assertIsInstance(python_source.tree, ast.Module)
+        self.assertEqual(python_source.parse_count, 1)
+
+        python_source.apply_changes(visitors[0].changes + visitors[1].changes)
+        self.assertEqual(python_source.code, "a.new_foo(b.baz(1))\nc.baz()\n")
+        python_source.visit([CallCollector("foo", "new_foo")])
+        self.assertEqual(python_source.parse_count, 2)
+
+    def test_apply_changes(self):
+        python_source = PythonSource("a = (1,\n     2)\nb = 3\n")
+        python_source.apply_changes(
+            [
+                # Several lines
+                ((1, 2, 4, 7), "(1, 2)"),
+                # Overlapping changes: the one starting first is ignored
+                ((3, 3, 4, 5), "4"),
+                ((3, 3, 0, 5), "b = 5"),
+            ]
+        )
+        self.assertEqual(python_source.code, "a = (1, 2)\nb = 4\n")
+
+    def test_code_edits(self):
+        # Column offsets of the tree are in UTF-8 bytes
+        code = "é = f(1,\n      2)  # é\ng = 'é' + h(3)\n"
+        tree = ast.parse(code)
+        edits = PythonSource(code).get_edits()
+        call_f = tree.body[0].value
+        call_h = tree.body[1].value.right
+        edits.replace_position(
+            (
+                call_f.lineno,
+                call_f.end_lineno,
+                call_f.col_offset,
+                call_f.end_col_offset,
+            ),
+            "f(1, 2)",
+        )
+        start = edits.get_offset(call_h.lineno, call_h.col_offset)
+        edits.replace(start, start + 1, "i")
+        self.assertEqual(edits.apply(), "é = f(1, 2)  # é\ng = 'é' + i(3)\n")
@@ -0,0 +1,80 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from odoo_module_migrate import rule_index
+from odoo_module_migrate.exception import ConfigException
+
+
+class TestRuleIndex(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self._scripts_path = os.path.join(tmp_dir.name, "migration_scripts")
+        os.makedirs(self._scripts_path)
+        for rule in rule_index._RULE_TYPES:
+            folder = rule_index._get_rule_folder(rule)
+            folder_path = os.path.join(rule_index._MIGRATION_SCRIPTS_PATH, folder)
+            if os.path.isdir(folder_path):
+                shutil.copytree(folder_path, os.path.join(self._scripts_path, folder))
+
+    def test_package_index_up_to_date(self):
+        # Run 'python -m odoo_module_migrate.rule_index' if it fails
+        scripts_path = rule_index._MIGRATION_SCRIPTS_PATH
+        index = rule_index._get_index(scripts_path)
+        self.assertEqual(sorted(index["steps"]), rule_index._get_steps(scripts_path))
+        for step, entry in index["steps"].items():
+            self.assertTrue(
+                rule_index._is_up_to_date(scripts_path, step, entry["folders"]), step
+            )
+            self.assertEqual(
+                entry["rules"], rule_index._read_step_rules(scripts_path, step)[0]
+            )
+
+    def test_changed_yaml(self):
+        rule_index.build_index(self._scripts_path)
+        path = os.path.join(
+            self._scripts_path,
+            "removed_models",
+            "migrate_150_160",
+            "removed_models.yaml",
+        )
+        # Touched, but unchanged: the rules are read from the index
+        os.utime(path, ns=(0, 0))
+        with unittest.mock.patch.object(
+            rule_index, "_read_step_rules", side_effect=AssertionError
+        ):
+            rules = rule_index.get_step_rules(self._scripts_path, "migrate_150_160")
+        self.assertNotIn(["foo.bar", None], rules["_REMOVED_MODELS"][0])
+
+        with open(path, "a") as f:
+            f.write('- ["foo.bar", null]\n')
+        rules = rule_index.get_step_rules(self._scripts_path, "migrate_150_160")
+        self.assertIn(["foo.bar", None], rules["_REMOVED_MODELS"][0])
+
+        # New file
+        with open(path.replace("removed_models.yaml", "new.yaml"), "w") as f:
+            f.write('- ["bar.baz", null]\n')
+        rules = rule_index.get_step_rules(self._scripts_path, "migrate_150_160")
+        self.assertEqual(rules["_REMOVED_MODELS"][0], [["bar.baz", None]])
+
+    def test_invalid_yaml(self):
+        path = os.path.join(self._scripts_path, "deprecated_modules", "migrate_150_160")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "invalid.yaml"), "w") as f:
+            f.write('- ["sale_foo", "renamed"]\n')
+        with self.assertRaisesRegex(ConfigException, "invalid.yaml"):
+            rule_index.build_index(self._scripts_path)
+
+    def test_short_item(self):
+        # The items are unpacked with their exact number of values
+        path = os.path.join(self._scripts_path, "removed_models", "migrate_150_160")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "short.yaml"), "w") as f:
+            f.write('- ["foo.bar"]\n')
+        with self.assertRaisesRegex(ConfigException, "should be a list of 2 items"):
+            rule_index.build_index(self._scripts_path)
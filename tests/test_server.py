@@ -0,0 +1,70 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import os
+import pathlib
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+
+from odoo_module_migrate.server import MigrationServer, send_job
+
+
+class TestMigrationServer(unittest.TestCase):
+
+    _template_path = pathlib.Path("./tests/data_template").resolve()
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self._tmp_path = pathlib.Path(tmp_dir.name)
+        self._working_path = self._tmp_path / "modules"
+        shutil.copytree(
+            self._template_path / "module_120", self._working_path / "module_120"
+        )
+        self._socket_path = str(self._tmp_path / "server.sock")
+        server = MigrationServer(self._socket_path, workers=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+    def test_socket_mode(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self._socket_path).st_mode), 0o600)
+
+    def test_jobs(self):
+        response = send_job(
+            self._socket_path,
+            ["check", "--init-version-name", "12.0", "--target-version-name", "13.0"],
+            cwd=str(self._working_path),
+        )
+        self.assertEqual(response["exit_code"], 0, response["stderr"])
+        findings = json.loads(response["stdout"])
+        self.assertTrue(findings)
+        self.assertTrue(all(x["file"].startswith("module_120/") for x in findings))
+
+        # Jobs are run one after another by the worker, each one with its
+        # own output
+        for __ in range(2):
+            response = send_job(
+                self._socket_path,
+                [
+                    "--init-version-name",
+                    "12.0",
+                    "--target-version-name",
+                    "13.0",
+                    "--no-commit",
+                    "--dry-run",
+                ],
+                cwd=str(self._working_path),
+            )
+            self.assertEqual(response["exit_code"], 0, response["stderr"])
+            self.assertIn("+++ b/module_120/", response["stdout"])
+            self.assertEqual(response["stderr"].count("Running migration from"), 1)
+
+        response = send_job(self._socket_path, ["--init-version-name", "1.0"])
+        self.assertEqual(response["exit_code"], 2)
+        self.assertIn("invalid choice", response["stderr"])
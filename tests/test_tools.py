@@ -0,0 +1,220 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import pathlib
+import re
+import subprocess
+import tempfile
+import unittest
+import unittest.mock
+
+from odoo_module_migrate import tools
+from odoo_module_migrate.file_buffer import FileBuffer
+
+
+class TestTools(unittest.TestCase):
+    def test_compile_pattern(self):
+        stats = dict(tools._compiled_patterns_stats)
+        pattern = tools._compile_pattern(r"test_compile_pattern\(")
+        self.assertIs(tools._compile_pattern(r"test_compile_pattern\("), pattern)
+        self.assertIsNot(
+            tools._compile_pattern(r"test_compile_pattern\(", re.IGNORECASE), pattern
+        )
+        self.assertEqual(tools._compiled_patterns_stats["misses"], stats["misses"] + 2)
+        self.assertEqual(tools._compiled_patterns_stats["hits"], stats["hits"] + 1)
+        # A pattern compiled beforehand is not a use of the cache
+        self.assertIs(tools._compile_pattern(pattern), pattern)
+        self.assertEqual(tools._compiled_patterns_stats["misses"], stats["misses"] + 2)
+        self.assertEqual(tools._compiled_patterns_stats["hits"], stats["hits"] + 1)
+        self.assertEqual(
+            tools._compiled_patterns_stats["precompiled"], stats["precompiled"] + 1
+        )
+
+    def test_file_buffer(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            module_path = pathlib.Path(module_path)
+            (module_path / "models").mkdir()
+            (module_path / "models" / "model.py").write_text("old")
+            (module_path / "views.xml").write_text("<odoo/>")
+            (module_path / "migrations").mkdir()
+            (module_path / "migrations" / "pre.py").write_text("")
+
+            file_buffer = FileBuffer(module_path)
+            with tools._use_file_buffer(file_buffer):
+                model_path = module_path / "models" / "model.py"
+                self.assertEqual(
+                    sorted(tools.get_files(module_path, (".py",))),
+                    [module_path / "migrations" / "pre.py", model_path],
+                )
+                self.assertEqual(tools._read_content(model_path), "old")
+                tools._write_content(model_path, "new")
+                tools._write_content(module_path / "new.csv", "id")
+                tools._remove_path(module_path / "migrations")
+                self.assertFalse(tools._path_exists(module_path / "migrations"))
+                self.assertTrue(tools._path_exists(module_path / "models"))
+                self.assertEqual(tools._read_content(model_path), "new")
+                # Nothing is written until the buffer is flushed
+                self.assertEqual(model_path.read_text(), "old")
+                self.assertTrue((module_path / "migrations").exists())
+            self.assertEqual(
+                tools._read_content(module_path / "models" / "model.py"), "old"
+            )
+
+            changed_paths = file_buffer.flush(False)
+            self.assertEqual(
+                sorted(changed_paths),
+                [
+                    str(module_path / "migrations" / "pre.py"),
+                    str(module_path / "models" / "model.py"),
+                    str(module_path / "new.csv"),
+                ],
+            )
+            self.assertEqual((module_path / "models" / "model.py").read_text(), "new")
+            self.assertEqual((module_path / "new.csv").read_text(), "id")
+            self.assertFalse((module_path / "migrations").exists())
+            self.assertEqual(file_buffer.flush(False), [])
+
+    def test_xml_document(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            module_path = pathlib.Path(module_path)
+            view_path = module_path / "views.xml"
+            view_path.write_text("<odoo>\n    <!-- é -->\n    <record/>\n</odoo>")
+
+            file_buffer = FileBuffer(module_path)
+            with tools._use_file_buffer(file_buffer):
+                xml_document = tools._get_xml_document(view_path)
+                self.assertIs(tools._get_xml_document(view_path), xml_document)
+                xml_document.tree.find("record").set("id", "foo")
+                tools._write_xml_document(view_path, xml_document)
+                with unittest.mock.patch.object(
+                    xml_document, "serialize", wraps=xml_document.serialize
+                ) as serialize:
+                    # The changed tree is shared, and serialized once
+                    self.assertIs(tools._get_xml_document(view_path), xml_document)
+                    content = tools._read_content(view_path)
+                    self.assertIs(tools._get_xml_document(view_path), xml_document)
+                    self.assertEqual(tools._read_content(view_path), content)
+                    self.assertEqual(serialize.call_count, 1)
+                self.assertEqual(
+                    content,
+                    '<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<odoo>\n    <!-- é -->\n    <record id="foo"/>\n</odoo>\n',
+                )
+                # A text change invalidates the tree
+                tools._replace_in_file(view_path, {"foo": "bar"})
+                xml_document = tools._get_xml_document(view_path)
+                self.assertEqual(xml_document.tree.find("record").get("id"), "bar")
+                xml_document.tree.find("record").set("id", "baz")
+                with tools._count_written_content() as written_content:
+                    tools._write_xml_document(view_path, xml_document)
+                content = tools._read_content(view_path)
+                self.assertEqual(
+                    written_content,
+                    {"files": {str(view_path)}, "bytes": len(content.encode("utf-8"))},
+                )
+            file_buffer.flush(False)
+            self.assertIn('<record id="baz"/>', view_path.read_text())
+
+    def test_update_content(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            file_path = pathlib.Path(module_path) / "model.py"
+            with tools._count_written_content() as written_content:
+                self.assertTrue(tools._update_content(file_path, "old"))
+                mtime = file_path.stat().st_mtime_ns
+                self.assertFalse(tools._update_content(file_path, "old"))
+                self.assertEqual(file_path.stat().st_mtime_ns, mtime)
+                self.assertTrue(tools._update_content(file_path, "new"))
+            self.assertEqual(written_content, {"files": {str(file_path)}, "bytes": 6})
+            self.assertEqual(file_path.read_text(), "new")
+
+    def test_file_buffer_git(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            module_path = pathlib.Path(module_path)
+            (module_path / "__openerp__.py").write_text("{}")
+            (module_path / "migrations").mkdir()
+            (module_path / "migrations" / "pre.py").write_text("")
+            subprocess.run(["git", "init", "-q"], cwd=module_path, check=True)
+            subprocess.run(["git", "add", "-A"], cwd=module_path, check=True)
+            subprocess.run(
+                ["git", "-c", "user.name=test", "-c", "user.email=test@test"]
+                + ["commit", "-q", "-m", "init"],
+                cwd=module_path,
+                check=True,
+            )
+
+            file_buffer = FileBuffer(module_path)
+            with tools._use_file_buffer(file_buffer):
+                tools._rename_path(
+                    module_path / "__openerp__.py", module_path / "__manifest__.py"
+                )
+                tools._remove_path(module_path / "migrations")
+            file_buffer.flush(True)
+
+            status = subprocess.check_output(
+                ["git", "status", "--porcelain"], cwd=module_path, text=True
+            )
+            self.assertEqual(
+                sorted(status.splitlines()),
+                ["D  migrations/pre.py", "R  __openerp__.py -> __manifest__.py"],
+            )
+
+    def test_file_buffer_diff_binary(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            module_path = pathlib.Path(module_path)
+            (module_path / "static").mkdir()
+            (module_path / "static" / "icon.png").write_bytes(b"\x89PNG\x00\xff")
+            (module_path / "migrations" / "__pycache__").mkdir(parents=True)
+            (module_path / "migrations" / "pre.py").write_text("pass\n")
+            (module_path / "migrations" / "__pycache__" / "pre.pyc").write_bytes(
+                bytes(range(256)) * 10
+            )
+            subprocess.run(["git", "init", "-q"], cwd=module_path, check=True)
+
+            file_buffer = FileBuffer(module_path)
+            with tools._use_file_buffer(file_buffer):
+                tools._remove_path(module_path / "migrations")
+            diff = file_buffer.diff(module_path)
+            self.assertIn("deleted file mode 100644\n", diff)
+            self.assertIn("GIT binary patch\n", diff)
+            self.assertNotIn("icon.png", diff)
+
+            # The patch can be applied
+            subprocess.run(
+                ["git", "apply", "-"],
+                input=diff.encode(),
+                cwd=module_path,
+                check=True,
+            )
+            self.assertFalse((module_path / "migrations" / "pre.py").exists())
+            self.assertFalse(
+                (module_path / "migrations" / "__pycache__" / "pre.pyc").exists()
+            )
+            self.assertTrue((module_path / "static" / "icon.png").exists())
+
+    def test_file_buffer_diff_line_endings(self):
+        with tempfile.TemporaryDirectory() as module_path:
+            module_path = pathlib.Path(module_path)
+            crlf_path = module_path / "crlf.py"
+            crlf_path.write_bytes(b"a = 1\r\nb = 2\r\n")
+            # Characters that are line ends for str.splitlines(), not for git
+            other_path = module_path / "other.py"
+            other_path.write_text("a = '\x0c\x1c\x85 '\nb = 2\nc = 3\n")
+            subprocess.run(["git", "init", "-q"], cwd=module_path, check=True)
+
+            file_buffer = FileBuffer(module_path)
+            with tools._use_file_buffer(file_buffer):
+                for path in (crlf_path, other_path):
+                    tools._replace_in_file(path, {"b = 2": "b = 4"})
+            diff = file_buffer.diff(module_path)
+            self.assertNotIn("No newline at end of file", diff)
+
+            subprocess.run(
+                ["git", "apply", "-"],
+                input=diff.encode(),
+                cwd=module_path,
+                check=True,
+            )
+            # Same files as the ones written by the buffer
+            self.assertEqual(crlf_path.read_bytes(), b"a = 1\nb = 4\n")
+            self.assertEqual(
+                other_path.read_text(), "a = '\x0c\x1c\x85 '\nb = 4\nc = 3\n"
+            )